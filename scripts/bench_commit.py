@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Benchmark the commit latency of the database file, with the default
+SQLite settings and with the pragmas of yaner.Database.
+
+Usage: ./scripts/bench_commit.py [ROWS] [COMMITS]
+
+The database files are created in TMPDIR, which should be on the same kind
+of disk as the data directory for meaningful results.
+"""
+import os
+import sys
+import time
+import tempfile
+
+from sqlalchemy import MetaData, Table, Column, Integer, BigInteger, Unicode
+from sqlalchemy import create_engine, bindparam
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from yaner.Database import create_database_engine
+
+def bench(engine, rows, commits):
+    """Return the seconds of inserting the rows in one transaction, and the
+    latencies of committing one state change of a row for several times.
+    """
+    metadata = MetaData()
+    task = Table('task', metadata,
+                 Column('id', Integer, primary_key=True),
+                 Column('name', Unicode),
+                 Column('state', Unicode, index=True),
+                 Column('gid', Unicode, index=True),
+                 Column('total_length', BigInteger),
+                 Column('completed_length', BigInteger),
+                 )
+    metadata.create_all(engine)
+
+    begin = time.time()
+    with engine.begin() as connection:
+        connection.execute(task.insert(), [
+            {'name': 'task {}'.format(i), 'state': 'waiting',
+             'gid': '{:016x}'.format(i), 'total_length': 1 << 30,
+             'completed_length': 0}
+            for i in range(rows)])
+    insert_time = time.time() - begin
+
+    update = task.update().where(task.c.id == bindparam('id_')).values(
+        state=bindparam('state'), completed_length=bindparam('length'))
+    latencies = []
+    for i in range(commits):
+        begin = time.time()
+        with engine.begin() as connection:
+            connection.execute(update, {'id_': i % rows + 1,
+                                        'state': 'complete', 'length': 1 << 30})
+        latencies.append(time.time() - begin)
+    return (insert_time, sorted(latencies))
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    commits = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    print('{} rows, {} commits of one state change each'.format(rows, commits))
+    for (label, factory) in (
+            ('default', lambda path: create_engine('sqlite:///' + path)),
+            ('tuned', create_database_engine)):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'yaner.db')
+        (insert_time, latencies) = bench(factory(path), rows, commits)
+        print('{:8} insert {:8.1f} ms  commit mean {:6.2f} ms  '
+              'p95 {:6.2f} ms  max {:6.2f} ms'.format(
+                  label, insert_time * 1000,
+                  sum(latencies) / len(latencies) * 1000,
+                  latencies[int(len(latencies) * 0.95)] * 1000,
+                  latencies[-1] * 1000))
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
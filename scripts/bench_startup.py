@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Measure the cold start of loading the pools, their presentables and the
+queuing tasks from a database file with many tasks.
+
+Usage: ./scripts/bench_startup.py [TASKS] [CATEGORIES]
+
+A quarter of the tasks are queuing, a quarter removed and the rest
+completed, spread over the categories of one pool.
+"""
+import os
+import sys
+import time
+import builtins
+import tempfile
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+builtins.__dict__.setdefault('_', lambda message: message)
+
+from yaner.Database import SQLSession, SQLBase, SQLCommitter
+from yaner.Database import create_database_engine
+from yaner.Pool import Pool
+from yaner.Task import Task, TaskURI, OptionProfile
+from yaner.Presentable import Category
+
+def populate(engine, tasks, categories):
+    """Fill the database with one pool, the categories and the tasks."""
+    SQLBase.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(Pool.__table__.insert(), [
+            {'id': 1, 'name': 'localhost', 'user': '', 'passwd': '',
+             'host': 'localhost', 'port': '6800', 'is_local': True}])
+        connection.execute(Category.__table__.insert(), [
+            {'id': i + 1, '_name_': 'category {}'.format(i),
+             'directory': '/tmp', 'pool_id': 1} for i in range(categories)])
+        connection.execute(OptionProfile.__table__.insert(), [
+            {'id': 1, 'digest': OptionProfile.get_digest({}), 'options': {}}])
+        states = ['waiting', 'removed', 'complete', 'complete']
+        connection.execute(Task.__table__.insert(), [
+            {'id': i + 1, 'name': 'task {}'.format(i), 'status': {},
+             'state': states[i % 4], 'gid': '{:016x}'.format(i),
+             'total_length': 1 << 20, 'completed_length': 1 << 19,
+             'profile_id': 1, 'session_id': '',
+             'category_id': i % categories + 1}
+            for i in range(tasks)])
+        connection.execute(TaskURI.__table__.insert(), [
+            {'task_id': i + 1, 'position': 0,
+             'uri': 'http://localhost/{}'.format(i)} for i in range(tasks)])
+
+def load():
+    """Load the pools, and read what the pool view shows."""
+    if hasattr(Pool, 'load_all'):
+        pools = Pool.load_all()
+    else:
+        pools = SQLSession.query(Pool).all()
+    for pool in pools:
+        for presentable in pool.presentables:
+            (presentable.name, presentable.task_count, presentable.total_length)
+    return pools
+
+if __name__ == '__main__':
+    tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    categories = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'yaner.db')
+    populate(create_database_engine(path), tasks, categories)
+
+    # A fresh engine, so nothing is cached by the populating connection
+    engine = create_database_engine(path)
+    SQLSession.configure(bind=engine)
+    SQLCommitter.start(engine)
+    statements = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda *args: statements.append(args[2]))
+
+    begin = time.time()
+    pools = load()
+    elapsed = time.time() - begin
+    print('{} tasks in {} categories: loaded in {:.1f} ms with {} queries, '
+          '{} queuing tasks'.format(tasks, categories, elapsed * 1000,
+                                    len(statements),
+                                    len(pools[0].queuing.tasks)))
+
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
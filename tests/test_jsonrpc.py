@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# vim:fileencoding=UTF-8
+
+# This file is part of Yaner.
+
+# Yaner - GTK+ interface for aria2 download mananger
+# Copyright (C) 2010-2011  Iven <ivenvd#gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Tests of the websocket L{Notifier<yaner.Jsonrpc.Notifier>} against a fake
+aria2 websocket server on a local port, and of how L{Pool<yaner.Pool.Pool>}
+handles the notifications.
+"""
+
+import json
+import time
+import base64
+import socket
+import struct
+import hashlib
+import logging
+import unittest
+import threading
+
+from gi.repository import GLib
+
+from yaner.Jsonrpc import Notifier
+from yaner.Pool import Pool
+
+_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+def _wait_for(condition, timeout=5):
+    """Run the main loop until the condition is true."""
+    context = GLib.MainContext.default()
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('timed out')
+        context.iteration(False)
+        time.sleep(0.01)
+
+class _FakeAria2(object):
+    """A fake websocket server of aria2, accepting one connection at a time
+    in a thread and running the script of the test on it.
+    """
+
+    def __init__(self):
+        self.socket = socket.socket()
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen(5)
+        self.port = self.socket.getsockname()[1]
+        self.headers = {}
+        self.received = []
+        self.error = None
+
+    def serve(self, script, status='101 Switching Protocols'):
+        """Accept a connection, handshake with the status, then run the
+        script with the connection if the handshake succeeded.
+        """
+        def run():
+            (connection, _) = self.socket.accept()
+            try:
+                self._handshake(connection, status)
+                if status.startswith('101'):
+                    script(connection)
+            except Exception as error:
+                self.error = error
+            finally:
+                connection.close()
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def close(self):
+        self.socket.close()
+
+    def _handshake(self, connection, status):
+        request = b''
+        while not request.endswith(b'\r\n\r\n'):
+            request += connection.recv(1)
+        lines = request.decode('latin-1').split('\r\n')
+        self.headers = dict(line.split(': ', 1) for line in lines[1:] if line)
+        accept = hashlib.sha1((self.headers['Sec-WebSocket-Key'] +
+                               _GUID).encode('ascii')).digest()
+        connection.sendall('\r\n'.join([
+            'HTTP/1.1 {}'.format(status),
+            'Upgrade: websocket',
+            'Connection: Upgrade',
+            'Content-Length: 0',
+            'Sec-WebSocket-Accept: {}'.format(
+                base64.b64encode(accept).decode('ascii')),
+            '', '']).encode('ascii'))
+
+    @staticmethod
+    def frame(opcode, payload, fin=True):
+        """Build an unmasked frame, as sent by servers."""
+        return bytes(((0x80 if fin else 0) | opcode, len(payload))) + payload
+
+    def read_frame(self, connection):
+        """Read a frame from the client, which must be masked."""
+        (byte0, byte1) = self._recv(connection, 2)
+        if not byte1 & 0x80:
+            raise AssertionError('frame from client is not masked')
+        mask = self._recv(connection, 4)
+        data = self._recv(connection, byte1 & 0x7F)
+        payload = bytes(b ^ mask[i % 4] for (i, b) in enumerate(data))
+        self.received.append((byte0 & 0x0F, payload))
+        return (byte0 & 0x0F, payload)
+
+    @staticmethod
+    def _recv(connection, size):
+        data = b''
+        while len(data) < size:
+            chunk = connection.recv(size - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+        return data
+
+class NotifierTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _FakeAria2()
+        self.notifier = Notifier('127.0.0.1', str(self.server.port),
+                                 'user', 'passwd')
+        self.events = []
+        self.notifier.connect('opened', lambda notifier:
+                              self.events.append(('opened',)))
+        self.notifier.connect('closed', lambda notifier:
+                              self.events.append(('closed',)))
+        self.notifier.connect('notification', lambda notifier, method, gid:
+                              self.events.append((method, gid)))
+
+    def tearDown(self):
+        self.notifier.close()
+        self.server.close()
+
+    def _notify(self, connection):
+        """Send a notification fragmented into two frames, with a ping
+        between them, then close the connection from the server side.
+        """
+        message = json.dumps({
+            'jsonrpc': '2.0', 'method': 'aria2.onDownloadStart',
+            'params': [{'gid': '1'}, {'gid': '2'}]}).encode('utf-8')
+        connection.sendall(self.server.frame(0x1, message[:10], fin=False) +
+                           self.server.frame(0x9, b'ping') +
+                           self.server.frame(0x0, message[10:]))
+        self.server.read_frame(connection)
+        connection.sendall(self.server.frame(0x8, struct.pack('!H', 1000)))
+        self.server.read_frame(connection)
+
+    def test_notification_and_server_close(self):
+        thread = self.server.serve(self._notify)
+        self.notifier.open()
+        _wait_for(lambda: ('closed',) in self.events)
+        thread.join(5)
+
+        self.assertIsNone(self.server.error)
+        self.assertEqual(self.server.headers['Authorization'],
+                         'Basic ' + base64.b64encode(b'user:passwd').decode())
+        self.assertEqual(self.events, [('opened',),
+                                       ('aria2.onDownloadStart', '1'),
+                                       ('aria2.onDownloadStart', '2'),
+                                       ('closed',)])
+        # Pong with the payload of the ping, and close replied
+        self.assertEqual(self.server.received[0], (0xA, b'ping'))
+        self.assertEqual(self.server.received[1][0], 0x8)
+        self.assertFalse(self.notifier.opened)
+        self.assertFalse(self.notifier.running)
+
+    def test_client_close_and_reopen(self):
+        for _ in range(2):
+            thread = self.server.serve(self.server.read_frame)
+            self.notifier.open()
+            _wait_for(lambda: self.notifier.opened)
+            self.notifier.close()
+            _wait_for(lambda: not self.notifier.running)
+            thread.join(5)
+
+            self.assertIsNone(self.server.error)
+            self.assertEqual(self.server.received.pop()[0], 0x8)
+        self.assertEqual(self.events, [('opened',), ('closed',)] * 2)
+        self.assertFalse(self.notifier.refused)
+
+    def test_refused(self):
+        thread = self.server.serve(None, status='404 Not Found')
+        self.notifier.open()
+        _wait_for(lambda: ('closed',) in self.events)
+        thread.join(5)
+
+        self.assertEqual(self.events, [('closed',)])
+        self.assertTrue(self.notifier.refused)
+
+class _FakePoller(object):
+
+    def __init__(self):
+        self.started = False
+        self.polled = []
+
+    def start(self):
+        self.started = True
+
+    def poll(self, tasks):
+        self.polled.append(tasks)
+
+class _FakeTask(object):
+
+    def __init__(self, gid, state):
+        self.gid = gid
+        self.state = state
+
+    @property
+    def is_running(self):
+        return self.state in ('active', 'waiting', 'paused')
+
+class _FakeQueuing(object):
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+
+class _FakePool(object):
+    """The part of L{Pool} used by its notifier handlers."""
+
+    def __init__(self, tasks, connected=True):
+        self.logger = logging.getLogger(__name__)
+        self.connected = connected
+        self.poller = _FakePoller()
+        self.queuing = _FakeQueuing(tasks)
+        self._tasks = dict((task.gid, task) for task in tasks)
+
+    def get_task_by_gid(self, gid):
+        return self._tasks.get(gid)
+
+class PoolNotificationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.task = _FakeTask('1', 'waiting')
+        self.pool = _FakePool([self.task, _FakeTask('2', 'complete')])
+
+    def _notify(self, method, gid='1'):
+        Pool._on_notification(self.pool, None, method, gid)
+
+    def test_states(self):
+        self._notify('aria2.onDownloadStart')
+        self.assertEqual(self.task.state, 'active')
+        self.assertTrue(self.pool.poller.started)
+
+        self._notify('aria2.onDownloadPause')
+        self.assertEqual(self.task.state, 'paused')
+
+        self._notify('aria2.onDownloadError')
+        self.assertEqual(self.task.state, 'error')
+
+    def test_stopped_polls_whole_status(self):
+        for method in ('aria2.onDownloadComplete', 'aria2.onDownloadStop',
+                       'aria2.onBtDownloadComplete'):
+            self._notify(method)
+        self.assertEqual(self.pool.poller.polled, [[self.task]] * 3)
+        self.assertEqual(self.task.state, 'waiting')
+
+    def test_unknown_gid(self):
+        self._notify('aria2.onDownloadStart', gid='3')
+        self.assertFalse(self.pool.poller.started)
+
+    def test_closed_falls_back_to_polling(self):
+        Pool._on_notifier_closed(self.pool, None)
+        self.assertTrue(self.pool.poller.started)
+        self.assertEqual(self.pool.poller.polled, [[self.task]])
+
+    def test_closed_when_disconnected(self):
+        self.pool.connected = False
+        Pool._on_notifier_closed(self.pool, None)
+        self.assertFalse(self.pool.poller.started)
+        self.assertEqual(self.pool.poller.polled, [])
+
+if __name__ == '__main__':
+    unittest.main()
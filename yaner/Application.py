@@ -29,12 +29,14 @@ import logging
 import subprocess
 
 from gi.repository import Gtk, GLib, Gio
-from sqlalchemy import create_engine
 
 from yaner import __package__
 from yaner.XDG import save_data_file
 from yaner.Pool import Pool
-from yaner.Database import SQLSession, SQLBase
+from yaner.Task import Task, OptionProfile
+from yaner.BlobStore import Blobs
+from yaner.Database import SQLSession, SQLBase, SQLCommitter
+from yaner.Database import create_database_engine, upgrade_database
 from yaner.Presentable import Category
 from yaner.ui.Toplevel import Toplevel
 from yaner.utils.Logging import LoggingMixin
@@ -57,6 +59,11 @@ class Application(Gtk.Application, LoggingMixin):
     _DATA_FILE = '{}.db'.format(_NAME)
     """The global database file of the application."""
 
+    _BLOB_DIR = 'blobs'
+    """The directory of the torrent and metalink files of the tasks, see
+    L{BlobStore<yaner.BlobStore.BlobStore>}.
+    """
+
     _SYNC_INTERVAL = 60
     """Interval for database sync, in second(s)."""
 
@@ -112,8 +119,10 @@ class Application(Gtk.Application, LoggingMixin):
         self.logger.info('Connecting to global database file...')
 
         data_file = save_data_file(self._DATA_FILE)
-        engine = create_engine('sqlite:///' + data_file)
+        engine = create_database_engine(data_file)
         SQLSession.configure(bind=engine)
+        SQLCommitter.start(engine)
+        Blobs.configure(save_data_file(self._BLOB_DIR))
 
         if not os.path.exists(data_file):
             self.logger.info('Initializing database for first start...')
@@ -131,13 +140,29 @@ class Application(Gtk.Application, LoggingMixin):
             music_dir = os.environ.get('XDG_MUSIC_DIR', os.path.expanduser('~'))
             Category(name=_('Music'), directory=music_dir, pool=pool)
 
+            # Write them before anything queries the database
+            SQLCommitter.commit()
+            SQLCommitter.wait()
+
             self.logger.info('Database initialized.')
+        else:
+            upgrade_database(engine)
+            # Remove the files and options of the tasks removed
+            Blobs.collect(Task.query_blobs())
+            OptionProfile.collect()
 
         # Auto commit to database
-        GLib.timeout_add_seconds(self._SYNC_INTERVAL, SQLSession.commit)
+        GLib.timeout_add_seconds(self._SYNC_INTERVAL, self._sync)
 
         self.logger.info('Global database file connected.')
 
+    def _sync(self):
+        """Persist the durable status of running tasks to database."""
+        for pool in Pool.get_all():
+            pool.sync_tasks()
+        SQLCommitter.commit()
+        return True
+
     def _init_action_group(self):
         """Insert 'cmdline' action for opening new task dialog."""
         action_group = Gio.SimpleActionGroup()
@@ -186,7 +211,8 @@ class Application(Gtk.Application, LoggingMixin):
     def do_shutdown(self):
         """When shutdown, finalize database and logging systems."""
         self.logger.info('Shutting down database...')
-        SQLSession.commit()
+        self._sync()
+        SQLCommitter.wait()
         SQLSession.close()
 
         self._daemon.terminate()
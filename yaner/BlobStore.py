@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# vim:fileencoding=UTF-8
+
+# This file is part of Yaner.
+
+# Yaner - GTK+ interface for aria2 download mananger
+# Copyright (C) 2010-2011  Iven <ivenvd#gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This module contains the L{BlobStore} class, which keeps the torrent and
+metalink files of the tasks out of the database.
+"""
+
+import os
+import mmap
+import hashlib
+import tempfile
+
+from xmlrpc.client import Binary
+
+from yaner.utils.Logging import LoggingMixin
+
+class BlobStore(LoggingMixin):
+    """
+    Content-addressed store of files in a directory. Each file is named by
+    the SHA-256 digest of its content, so storing the same content again
+    costs nothing, and only the digest needs to be kept in database.
+    """
+
+    def __init__(self, directory=None):
+        """
+        L{BlobStore} initializing.
+        @arg directory:The directory to store files in, can be set later by
+        L{configure}.
+        """
+        LoggingMixin.__init__(self)
+
+        self.directory = directory
+
+    def configure(self, directory):
+        """Set the directory to store files in."""
+        self.directory = directory
+
+    def get_path(self, digest):
+        """Get the path of the file of the digest, which is put in a
+        subdirectory named by the first two characters of the digest.
+        """
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, data):
+        """Store the data if it's not stored yet, and return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.get_path(digest)
+        if not os.path.exists(path):
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            # Write to a temporary file first, so a partial file never
+            # appears with the name of the digest
+            (fd, temp_path) = tempfile.mkstemp(dir=directory)
+            try:
+                with os.fdopen(fd, 'wb') as temp_file:
+                    temp_file.write(data)
+                os.replace(temp_path, path)
+            except Exception:
+                os.remove(temp_path)
+                raise
+        return digest
+
+    def open(self, digest):
+        """Get the content of the file of the digest, memory-mapped so it's
+        not copied until it's read.
+        """
+        with open(self.get_path(digest), 'rb') as blob_file:
+            if not os.fstat(blob_file.fileno()).st_size:
+                return b''
+            return mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def open_binary(self, digest):
+        """Get the content of the file of the digest as the binary argument
+        of xmlrpc calls, which is encoded from the memory-mapped file when
+        the call is sent.
+        """
+        binary = Binary()
+        # Binary only accepts bytes, while encoding works with any buffer
+        binary.data = self.open(digest)
+        return binary
+
+    def collect(self, digests):
+        """Remove the files whose digests are not in C{digests}, which
+        should be all the digests still referenced.
+        """
+        digests = set(digests)
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        for subdirectory in os.listdir(self.directory):
+            subdirectory = os.path.join(self.directory, subdirectory)
+            if not os.path.isdir(subdirectory):
+                continue
+            for name in os.listdir(subdirectory):
+                if name not in digests:
+                    self.logger.debug('Removing blob {}...'.format(name))
+                    os.remove(os.path.join(subdirectory, name))
+
+Blobs = BlobStore()
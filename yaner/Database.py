@@ -24,13 +24,47 @@
 This module contains classes and constants related to database.
 """
 
+from gi.repository import GLib
 from gi.repository.GObject import GObjectMeta
 
-from sqlalchemy import Column, Integer
+from sqlalchemy import Column, Integer, create_engine, event, func
+from sqlalchemy.engine.reflection import Inspector
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.declarative import DeclarativeMeta, declared_attr
 
+from yaner.Persistence import PersistenceWorker, take_snapshot, restore_snapshot
+
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16384),
+    ('mmap_size', 64 * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+    )
+"""
+Pragmas applied to every connection of the database file. With WAL
+journaling and normal synchronous, a commit appends to the log without
+waiting for the database file to be synced. The cache size is in KiB when
+negative, and the mmap size is in bytes.
+"""
+
+def create_database_engine(data_file, pragmas=SQLITE_PRAGMAS):
+    """Create the engine of the SQLite database file, with the pragmas
+    applied to every connection it opens.
+    """
+    engine = create_engine('sqlite:///' + data_file)
+
+    def on_connect(dbapi_connection, connection_record):
+        """Apply the pragmas to the new connection."""
+        cursor = dbapi_connection.cursor()
+        for (name, value) in pragmas:
+            cursor.execute('PRAGMA {}={}'.format(name, value))
+        cursor.close()
+
+    event.listen(engine, 'connect', on_connect)
+    return engine
+
 class DeclarativeGObjectMeta(DeclarativeMeta, GObjectMeta):
     """Metaclass for Declarative and GObject subclasses."""
     pass
@@ -44,6 +78,146 @@ class _SQLBase(object):
 
     id = Column(Integer, primary_key=True)
 
-SQLSession = scoped_session(sessionmaker())
+class CommitScheduler(object):
+    """
+    Write-behind committer of a session. Changes are committed a short delay
+    after the first L{schedule} call, so a burst of changes costs one
+    transaction instead of one for each change.
+
+    Committing only takes a snapshot of the changes, which is written by a
+    L{PersistenceWorker<yaner.Persistence.PersistenceWorker>}, so the main
+    loop never waits for the disk. The session is never flushed, new
+    objects must be added by L{add} to get their primary keys.
+    """
+
+    DELAY = 500
+    """Default delay before committing, in millisecond(s)."""
+
+    def __init__(self, session, delay=DELAY):
+        """
+        L{CommitScheduler} initializing.
+        @arg session:The session to commit.
+        @arg delay:Delay before committing, in millisecond(s).
+        @type delay:L{int}
+        """
+        self.session = session
+        self.delay = delay
+
+        self._handle = None
+        self._worker = None
+        self._last_ids = {}
+        self._statements = []
+
+    @property
+    def pending(self):
+        """If there is a commit scheduled."""
+        return self._handle is not None
+
+    def start(self, engine):
+        """Start the worker writing to the database of the engine."""
+        self._worker = PersistenceWorker(engine, self._on_write_failed)
+
+    def add(self, obj):
+        """Add the new object to the session, with its primary key assigned
+        from the max one of its table.
+        """
+        table = obj.__table__
+        if table not in self._last_ids:
+            self._last_ids[table] = \
+                    self.session.query(func.max(table.c.id)).scalar() or 0
+        self._last_ids[table] += 1
+        obj.id = self._last_ids[table]
+        self.session.add(obj)
+
+    def schedule(self):
+        """Mark the session dirty, and commit it after the delay, if it's
+        not scheduled yet.
+        """
+        if self._handle is None:
+            self._handle = GLib.timeout_add(self.delay, self._on_timeout)
+
+    def commit(self):
+        """Commit the session right now, for the changes which should be
+        durable immediately, like creating tasks or shutting down.
+        """
+        if self._handle is not None:
+            GLib.source_remove(self._handle)
+            self._handle = None
+        self._commit()
+
+    def execute(self, *statements):
+        """Commit the session right now, and execute the set-based
+        statements in the same transaction after the changes, for bulk
+        operations which shouldn't go through the objects one by one.
+        """
+        self._statements.extend(statements)
+        self.commit()
+
+    def wait(self):
+        """Block until all the commits are written to database."""
+        if self._worker is not None:
+            self._worker.join()
+
+    def _on_timeout(self):
+        """Commit when the delay passed."""
+        self._handle = None
+        self._commit()
+        return False
+
+    def _commit(self):
+        """Hand the snapshot of the changes to the worker."""
+        operations = take_snapshot(self.session)
+        operations.extend(('execute', statement, None, None)
+                          for statement in self._statements)
+        self._statements = []
+        if operations:
+            self._worker.submit(operations)
+
+    def _on_write_failed(self, operations):
+        """Called in the worker thread when a snapshot failed to be
+        written, restore it in the main loop to be written again.
+        """
+        GLib.idle_add(self._restore, operations)
+
+    def _restore(self, operations):
+        """Mark the changes of the failed snapshot dirty again, and schedule
+        a commit to retry.
+        """
+        self._statements[:0] = restore_snapshot(self.session, operations)
+        self.schedule()
+        return False
+
+SQLSession = scoped_session(sessionmaker(autoflush=False,
+                                         expire_on_commit=False))
 SQLBase = declarative_base(cls=_SQLBase, metaclass=DeclarativeGObjectMeta)
+SQLCommitter = CommitScheduler(SQLSession)
+
+def upgrade_database(engine):
+    """Upgrade the database file created by an older version, by creating
+    the missing tables, columns and indexes.
 
+    The mapped classes can define a C{__upgrade__(connection, columns)}
+    classmethod, which is called with the names of the columns added to its
+    table, to fill them with existing data.
+    """
+    SQLBase.metadata.create_all(engine)
+    inspector = Inspector.from_engine(engine)
+    classes = dict((cls.__table__.name, cls) for cls in SQLBase.__subclasses__())
+    with engine.begin() as connection:
+        for table in SQLBase.metadata.sorted_tables:
+            existing_columns = set(column['name'] for column in
+                                   inspector.get_columns(table.name))
+            columns = [column for column in table.columns
+                       if column.name not in existing_columns]
+            for column in columns:
+                connection.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    table.name, column.name,
+                    column.type.compile(dialect=engine.dialect)))
+            existing_indexes = set(index['name'] for index in
+                                   inspector.get_indexes(table.name))
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+            if columns and hasattr(classes.get(table.name), '__upgrade__'):
+                classes[table.name].__upgrade__(
+                    connection, [column.name for column in columns])
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# vim:fileencoding=UTF-8
+
+# This file is part of Yaner.
+
+# Yaner - GTK+ interface for aria2 download mananger
+# Copyright (C) 2010-2011  Iven <ivenvd#gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""This module contains the websocket JSON-RPC notifier of aria2."""
+
+import json
+import base64
+import socket
+import threading
+
+import websocket
+
+from gi.repository import GLib
+from gi.repository import GObject
+
+from yaner.utils.Logging import LoggingMixin
+
+class Notifier(GObject.GObject, LoggingMixin):
+    """Listen to the notifications sent by aria2 over its websocket JSON-RPC
+    interface, such as C{aria2.onDownloadStart}.
+
+    The websocket protocol is handled by the C{websocket-client} library.
+    The socket is read in a thread of its own, the signals are always
+    emitted in the main loop.
+    """
+
+    __gsignals__ = {
+            'opened': (GObject.SignalFlags.RUN_LAST, None, ()),
+            'closed': (GObject.SignalFlags.RUN_LAST, None, ()),
+            'notification': (GObject.SignalFlags.RUN_LAST, None, (str, str)),
+            }
+    """
+    GObject signals of this class. The arguments of "notification" are the
+    method name and the gid of the task.
+    """
+
+    _TIMEOUT = 10
+    """Timeout for connecting and handshaking, in second(s)."""
+
+    def __init__(self, host, port, user='', passwd='', path='/jsonrpc'):
+        """L{Notifier} initializing.
+
+        @arg host:Host of the aria2 server.
+        @type host:L{str}
+        @arg port:Port of the aria2 server.
+        @type port:L{str}
+        @arg user:The rpc user of the aria2 server.
+        @type user:L{str}
+        @arg passwd:The rpc password of the aria2 server.
+        @type passwd:L{str}
+        @arg path:Path of the websocket endpoint.
+        @type path:L{str}
+
+        """
+        GObject.GObject.__init__(self)
+        LoggingMixin.__init__(self)
+
+        self.host = host
+        self.port = port
+        self.user = user
+        self.passwd = passwd
+        self.path = path
+
+        self._websocket = None
+        self._thread = None
+        self._opened = False
+        self._refused = False
+        self._lock = threading.Lock()
+
+    @property
+    def opened(self):
+        """Check if the websocket is opened."""
+        return self._opened
+
+    @property
+    def refused(self):
+        """Check if the server refused the websocket handshake the last time
+        it's opened, like aria2 older than 1.15.2 without the websocket
+        interface, so there's no point reopening it.
+        """
+        return self._refused
+
+    @property
+    def running(self):
+        """Check if the websocket is opened or being opened."""
+        return self._thread is not None
+
+    def open(self):
+        """Open the websocket in the background, emit "opened" when done."""
+        if self._thread is None:
+            self._refused = False
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def close(self):
+        """Close the websocket, "closed" will be emitted."""
+        with self._lock:
+            if self._websocket is not None:
+                # The reading thread drops the socket once the server
+                # closes the connection, so keep it
+                sock = self._websocket.sock
+                try:
+                    self._websocket.send_close()
+                    # Wake up the thread reading the websocket
+                    if sock is not None:
+                        sock.shutdown(socket.SHUT_RDWR)
+                except (socket.error, websocket.WebSocketException):
+                    pass
+
+    def _run(self):
+        """Connect to the server and keep reading notifications."""
+        try:
+            try:
+                self._connect()
+            except websocket.WebSocketBadStatusException:
+                self._refused = True
+                raise
+            GLib.idle_add(self._on_opened)
+            while True:
+                (opcode, payload) = self._websocket.recv_data()
+                if opcode == websocket.ABNF.OPCODE_CLOSE:
+                    break
+                elif opcode == websocket.ABNF.OPCODE_TEXT:
+                    self._dispatch(payload.decode('utf-8'))
+        except (socket.error, websocket.WebSocketException, ValueError) as error:
+            self.logger.info('Websocket of {}:{} closed: {}.'.format(
+                self.host, self.port, error))
+        finally:
+            with self._lock:
+                if self._websocket is not None:
+                    self._websocket.shutdown()
+                    self._websocket = None
+            GLib.idle_add(self._on_closed)
+
+    def _on_opened(self):
+        """Mark the websocket as opened in the main loop."""
+        self._opened = True
+        self.emit('opened')
+
+    def _on_closed(self):
+        """Mark the websocket as closed in the main loop."""
+        self._opened = False
+        self._thread = None
+        self.emit('closed')
+
+    def _dispatch(self, message):
+        """Emit "notification" for every notification in the message.
+        Responses of requests are ignored since we don't send any.
+        """
+        message = json.loads(message)
+        for item in (message if isinstance(message, list) else [message]):
+            method = item.get('method')
+            if method is None:
+                continue
+            for event in item.get('params', []):
+                GLib.idle_add(self.emit, 'notification', method, event['gid'])
+
+    def _connect(self):
+        """Open the websocket, pings from the server are answered by the
+        library when reading.
+        """
+        headers = []
+        if self.user:
+            auth = '{}:{}'.format(self.user, self.passwd).encode('utf-8')
+            headers.append('Authorization: Basic {}'.format(
+                base64.b64encode(auth).decode('ascii')))
+        url = 'ws://{}:{}{}'.format(self.host, self.port, self.path)
+        connection = websocket.create_connection(url, timeout=self._TIMEOUT,
+                                                 header=headers)
+        with self._lock:
+            self._websocket = connection
+        connection.settimeout(None)
+
+GObject.type_register(Notifier)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# vim:fileencoding=UTF-8
+
+# This file is part of Yaner.
+
+# Yaner - GTK+ interface for aria2 download mananger
+# Copyright (C) 2010-2011  Iven <ivenvd#gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This module contains the L{PersistenceWorker} class, which writes the
+changes of the objects to database in a background thread.
+"""
+
+import queue
+import threading
+
+from sqlalchemy.orm import sessionmaker, make_transient
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm import ColumnProperty, RelationshipProperty
+from sqlalchemy.orm.interfaces import MANYTOONE
+from sqlalchemy.orm.attributes import instance_state, get_history
+from sqlalchemy.orm.attributes import flag_modified, PASSIVE_NO_INITIALIZE
+
+from yaner.utils.Logging import LoggingMixin
+
+def _copy_value(value):
+    """Copy the mutable values, so the worker gets what they were when the
+    snapshot was taken.
+    """
+    if isinstance(value, dict):
+        return dict(value)
+    elif isinstance(value, list):
+        return list(value)
+    else:
+        return value
+
+def _get_values(obj, is_new):
+    """Get the column values of the object to write, keyed by column. For a
+    new object, all the columns with defaults filled in, otherwise only the
+    changed ones.
+    """
+    state = instance_state(obj)
+    values = {}
+    # Columns first, so the foreign keys synced from the relationships
+    # override them
+    properties = sorted(state.mapper.iterate_properties,
+                        key=lambda prop: not isinstance(prop, ColumnProperty))
+    for prop in properties:
+        if isinstance(prop, ColumnProperty):
+            column = prop.columns[0]
+            if is_new:
+                if prop.key not in state.dict:
+                    default = column.default
+                    value = default.arg if default is not None and \
+                            default.is_scalar else None
+                    setattr(obj, prop.key, _copy_value(value))
+                values[column.key] = _copy_value(state.dict[prop.key])
+            else:
+                history = get_history(obj, prop.key, PASSIVE_NO_INITIALIZE)
+                if history.added:
+                    values[column.key] = _copy_value(history.added[0])
+        elif isinstance(prop, RelationshipProperty) and \
+                prop.direction is MANYTOONE:
+            # Foreign keys are only synced from the relationships by flushes
+            if not is_new and not get_history(obj, prop.key,
+                                              PASSIVE_NO_INITIALIZE).added:
+                continue
+            related = state.dict.get(prop.key)
+            for (local, remote) in prop.local_remote_pairs:
+                if related is None:
+                    values[local.key] = None
+                else:
+                    key = prop.mapper.get_property_by_column(remote).key
+                    values[local.key] = getattr(related, key)
+    return values
+
+def take_snapshot(session):
+    """Take the changes of the session as a list of C{(operation, table,
+    values, obj)}, in the order they should be written, and mark the
+    objects clean without flushing. If the snapshot fails to be written,
+    L{restore_snapshot} marks them dirty again.
+
+    New objects must have their primary keys assigned, or C{ValueError} is
+    raised before anything changes. Rows are inserted parents first and
+    deleted children first.
+    """
+    new = list(session.new)
+    dirty = list(session.dirty)
+    deleted = list(session.deleted)
+
+    for obj in new:
+        # Objects reaching the session by cascade don't get the key
+        # assigned, writing them would insert rows without id
+        if obj.id is None:
+            raise ValueError('{!r} has no primary key assigned.'.format(obj))
+
+    def table_order(obj):
+        table = instance_state(obj).mapper.local_table
+        return table.metadata.sorted_tables.index(table)
+
+    operations = []
+    for obj in sorted(new, key=table_order):
+        operations.append(('insert', instance_state(obj).mapper.local_table,
+                           _get_values(obj, True), obj))
+    for obj in dirty:
+        values = _get_values(obj, False) if session.is_modified(obj) else None
+        if values:
+            values['id'] = obj.id
+            operations.append(('update', instance_state(obj).mapper.local_table,
+                               values, obj))
+    for obj in sorted(deleted, key=table_order, reverse=True):
+        operations.append(('delete', instance_state(obj).mapper.local_table,
+                           {'id': obj.id}, obj))
+
+    # Reset the history of the objects by taking them out of the session
+    # and adding them back as if they were loaded with the current values.
+    # Expunging cascades to related objects, which may be new ones too
+    for obj in dirty:
+        make_transient(obj)
+    for obj in new:
+        if obj in session:
+            session.expunge(obj)
+    for obj in new + dirty:
+        make_transient_to_detached(obj)
+    for obj in new + dirty:
+        session.add(obj)
+    for obj in deleted:
+        if obj in session:
+            session.expunge(obj)
+    return operations
+
+def restore_snapshot(session, operations):
+    """Mark the changes of the snapshot which failed to be written dirty
+    again, so they are taken by the next snapshot, with the current values
+    of the objects. Return the statements of the C{execute} operations,
+    which should be executed again.
+    """
+    statements = []
+    for (operation, table, values, obj) in operations:
+        if operation == 'execute':
+            statements.append(table)
+        elif operation == 'insert':
+            if obj in session and obj not in session.deleted:
+                make_transient(obj)
+                session.add(obj)
+        elif operation == 'update':
+            if obj in session and obj not in session.deleted:
+                state = instance_state(obj)
+                for prop in state.mapper.iterate_properties:
+                    if prop.key not in state.dict:
+                        continue
+                    if isinstance(prop, ColumnProperty):
+                        columns = prop.columns
+                    elif isinstance(prop, RelationshipProperty) and \
+                            prop.direction is MANYTOONE:
+                        # The foreign key is synced from the relationship
+                        columns = prop.local_columns
+                    else:
+                        continue
+                    if any(column.key in values for column in columns):
+                        flag_modified(obj, prop.key)
+        elif obj not in session:
+            session.add(obj)
+            session.delete(obj)
+    return statements
+
+class PersistenceWorker(LoggingMixin):
+    """
+    A thread writing the snapshots taken by L{take_snapshot} with its own
+    session. Each snapshot is written in one transaction, in the order they
+    are submitted.
+    """
+
+    def __init__(self, engine, on_failed=None):
+        """
+        L{PersistenceWorker} initializing.
+        @arg engine:The engine of the database to write to.
+        @arg on_failed:Called with the snapshot in the worker thread, when
+        the snapshot failed to be written and is rolled back.
+        """
+        LoggingMixin.__init__(self)
+
+        self._on_failed = on_failed
+        self._session = sessionmaker(bind=engine)()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, operations):
+        """Queue the operations to write."""
+        self._queue.put(operations)
+
+    def join(self):
+        """Wait until all the queued operations are written."""
+        self._queue.join()
+
+    def _work(self):
+        """Keep writing operations from the queue."""
+        while True:
+            operations = self._queue.get()
+            try:
+                self._write(operations)
+            except Exception:
+                self.logger.exception('Failed to write to database.')
+                self._session.rollback()
+                if self._on_failed is not None:
+                    self._on_failed(operations)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, operations):
+        """Write the operations in one transaction, grouping the inserts and
+        deletes of the same table. The C{execute} operations carry a
+        statement in place of the table.
+        """
+        index = 0
+        while index < len(operations):
+            (operation, table, values, obj) = operations[index]
+            end = index + 1
+            if operation in ('insert', 'delete'):
+                while end < len(operations) and \
+                        operations[end][0] == operation and \
+                        operations[end][1] is table:
+                    end += 1
+            if operation == 'execute':
+                self._session.execute(table)
+            elif operation == 'insert':
+                self._session.execute(table.insert(), [
+                    item[2] for item in operations[index:end]])
+            elif operation == 'update':
+                values = dict(values)
+                id_ = values.pop('id')
+                self._session.execute(
+                    table.update().where(table.c.id == id_).values(values))
+            else:
+                self._session.execute(table.delete().where(table.c.id.in_(
+                    [item[2]['id'] for item in operations[index:end]])))
+            index = end
+        self._session.commit()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# vim:fileencoding=UTF-8
+
+# This file is part of Yaner.
+
+# Yaner - GTK+ interface for aria2 download mananger
+# Copyright (C) 2010-2011  Iven <ivenvd#gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This module contains the L{StatusPoller} class of L{yaner}.
+"""
+
+from functools import partial
+
+from gi.repository import GLib
+
+from yaner.utils.Logging import LoggingMixin
+
+class StatusPoller(LoggingMixin):
+    """
+    Poll the status of all running tasks of a L{Pool<yaner.Pool>} on every
+    tick, using one C{system.multicall} per L{batch_size} tasks instead of
+    one C{aria2.tellStatus} call per task.
+
+    When the L{Notifier<yaner.Jsonrpc.Notifier>} of the pool is opened,
+    state changes are pushed by aria2, so only active tasks, whose
+    progress keeps changing, are polled.
+    """
+
+    INTERVAL = 1
+    """Default interval for status polling, in second(s)."""
+
+    BATCH_SIZE = 100
+    """Default max number of C{aria2.tellStatus} calls in a multicall."""
+
+    STATUS_KEYS = ['gid', 'status', 'completedLength', 'totalLength',
+                   'downloadSpeed', 'uploadSpeed', 'connections',
+                   'followedBy', 'belongsTo']
+    """
+    Keys of the status fetched on every tick. The heavy ones, like C{files}
+    and C{bittorrent}, are only fetched when the task wants details.
+    """
+
+    def __init__(self, pool, interval=INTERVAL, batch_size=BATCH_SIZE):
+        """
+        L{StatusPoller} initializing.
+        @arg pool:The pool whose tasks to poll.
+        @type pool:L{yaner.Pool}
+        @arg interval:Interval for status polling, in second(s).
+        @type interval:L{int}
+        @arg batch_size:Max number of tasks polled in one multicall.
+        @type batch_size:L{int}
+        """
+        LoggingMixin.__init__(self)
+
+        self.pool = pool
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self._handle = None
+        self._pending = 0
+
+    @property
+    def polling(self):
+        """Check if the poller is running."""
+        return self._handle is not None
+
+    def start(self):
+        """Begin to poll the running tasks every L{interval} seconds."""
+        if self._handle is None:
+            self.logger.info('{}: begin polling status.'.format(self.pool))
+            self._handle = GLib.timeout_add_seconds(self.interval, self._tick)
+
+    def stop(self):
+        """Stop polling."""
+        if self._handle is not None:
+            self.logger.info('{}: end polling status.'.format(self.pool))
+            GLib.source_remove(self._handle)
+            self._handle = None
+
+    def _tick(self):
+        """Call pool for the status of all running tasks.
+
+        Return True to keep calling this when timeout else stop.
+
+        """
+        if self._pending:
+            # The last tick is still in flight, don't pile up calls
+            return True
+
+        if self.pool.notifier.opened:
+            tasks = [task for task in self.pool.queuing.tasks if task.is_active]
+        else:
+            tasks = [task for task in self.pool.queuing.tasks if task.is_running]
+        if not tasks:
+            self.logger.info('{}: end polling status.'.format(self.pool))
+            self._handle = None
+            return False
+
+        self.poll(tasks)
+        return True
+
+    def poll(self, tasks):
+        """Call pool for the status of the given tasks right now."""
+        for start in range(0, len(tasks), self.batch_size):
+            batch = tasks[start:start + self.batch_size]
+            calls = [{'methodName': 'aria2.tellStatus',
+                      'params': self._get_params(task)} for task in batch]
+            deferred = self.pool.proxy.call('system.multicall', calls)
+            deferred.add_callback(partial(self._on_got_status, batch))
+            deferred.add_faultback(self._on_failed)
+            deferred.add_errback(self._on_failed)
+            deferred.start()
+            self._pending += 1
+
+    def _get_params(self, task):
+        """Get the parameters of C{aria2.tellStatus} for the task."""
+        if task.wants_details:
+            return [task.gid]
+        else:
+            return [task.gid, self.STATUS_KEYS]
+
+    def _on_got_status(self, tasks, deferred):
+        """Fan the results of the multicall out to the tasks."""
+        self._pending -= 1
+        for (task, result) in zip(tasks, deferred.result):
+            if isinstance(result, dict):
+                self.logger.warning('{}: {}'.format(task, result['faultString']))
+            elif task.is_running:
+                task._update_status(result[0])
+        self.pool.connected = True
+
+    def _on_failed(self, deferred):
+        """When the multicall failed, mark the pool as disconnected, unless
+        it's just dropped because too many calls are waiting.
+        """
+        self._pending -= 1
+        if deferred.error is not None and not deferred.overloaded:
+            self.pool._on_xmlrpc_error(deferred)
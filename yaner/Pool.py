@@ -26,14 +26,19 @@ This module contains the L{Pool} class of L{yaner}.
 
 import os
 
+from collections import OrderedDict
+from functools import partial
 from gi.repository import GLib
 from gi.repository import GObject
-from sqlalchemy import Column, Unicode, Boolean
-from sqlalchemy.orm import reconstructor, relationship
-from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy import Column, Unicode, Boolean, func, select
+from sqlalchemy.orm import reconstructor, relationship, subqueryload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from yaner.Xmlrpc import ServerProxy
-from yaner.Database import SQLSession, SQLBase
+from yaner.Jsonrpc import Notifier
+from yaner.Poller import StatusPoller
+from yaner.Task import Task, TaskRecord, TaskURI
+from yaner.Database import SQLSession, SQLBase, SQLCommitter
 from yaner.Presentable import Presentable, Queuing, Category, Dustbin
 from yaner.utils.Logging import LoggingMixin
 
@@ -60,6 +65,46 @@ class Pool(SQLBase, GObject.GObject, LoggingMixin):
     _CONNECTION_INTERVAL = 5
     """Interval for keeping connection, in second(s)."""
 
+    _CONNECTION_POOL_SIZE = 4
+    """Max number of kept-alive xmlrpc connections to the server, which is
+    also the number of worker threads making the calls.
+    """
+
+    _CALL_QUEUE_SIZE = 128
+    """Max number of xmlrpc calls waiting for a worker thread."""
+
+    _UPDATE_INTERVAL = 1
+    """Interval for task status updating, in second(s)."""
+
+    _UPDATE_BATCH_SIZE = 100
+    """Max number of tasks whose status is updated in one multicall."""
+
+    _ADD_BATCH_SIZE = 100
+    """Max number of tasks added to aria2 in one multicall."""
+
+    _OPERATION_BATCH_SIZE = 100
+    """Max number of tasks started, paused or removed in one multicall."""
+
+    _PROMOTE_BATCH_SIZE = 500
+    """Max number of L{TaskRecord}s promoted by one query."""
+
+    _REMOVE_BATCH_SIZE = 500
+    """Max number of tasks deleted by one statement."""
+
+    _RECONCILE_PAGE_SIZE = 500
+    """Number of tasks got by every C{aria2.tellWaiting} or
+    C{aria2.tellStopped} call when reconciling.
+    """
+
+    _pools = []
+    """The pools started, including the ones not written to database yet."""
+
+    _RECONCILE_KEYS = StatusPoller.STATUS_KEYS + ['infoHash', 'files']
+    """Status keys of the running tasks, used to match the tasks in the
+    pool by infohash or URI when reconciling. Stopped tasks are only matched
+    by gid, so only the keys of L{StatusPoller} are got for them.
+    """
+
     name = Column(Unicode)
     user = Column(Unicode)
     passwd = Column(Unicode)
@@ -78,10 +123,63 @@ class Pool(SQLBase, GObject.GObject, LoggingMixin):
         self.port = port
         self.is_local = is_local
 
-        SQLSession.add(self)
-        SQLSession.commit()
+        SQLCommitter.add(self)
+        SQLCommitter.schedule()
 
         self._init()
+        self._start()
+
+    @classmethod
+    def load_all(cls):
+        """Load all the pools with their categories, the aggregates of the
+        presentables and the queuing tasks in a few queries, and start the
+        pools. Pools must be loaded by this at startup. The pools already
+        started are returned as they are.
+        """
+        all_pools = SQLSession.query(cls).options(
+            subqueryload(cls.categories), subqueryload(cls.default_category)).all()
+        pools = [pool for pool in all_pools if pool not in cls._pools]
+        categories = dict((category.id, category)
+                          for pool in pools for category in pool.categories)
+
+        query = SQLSession.query(Task.category_id, Task.state,
+                                 func.count(Task.id),
+                                 func.sum(Task._total_length),
+                                 func.sum(Task._completed_length))
+        for (category_id, state, count, total_length, completed_length) in \
+                query.group_by(Task.category_id, Task.state):
+            category = categories.get(category_id)
+            if category is None:
+                continue
+            if state == 'complete':
+                presentable = category
+            elif state == 'removed':
+                presentable = category.pool.dustbin
+            else:
+                presentable = category.pool.queuing
+            presentable.update_aggregates(
+                count, (int(total_length or 0), int(completed_length or 0), 0, 0))
+
+        for pool in pools:
+            pool._presentable_tasks[pool.queuing] = OrderedDict()
+        for task in SQLSession.query(Task).filter(Task.in_queuing).options(
+                subqueryload(Task._uris)).order_by(Task.id):
+            category = categories.get(task.category_id)
+            if category is not None:
+                queuing = category.pool.queuing
+                category.pool._presentable_tasks[queuing][task.id] = task
+                category.pool._task_presentables[task.id] = (queuing, task)
+
+        for pool in pools:
+            pool._start()
+        return all_pools
+
+    @classmethod
+    def get_all(cls):
+        """Get all the pools started, which should be used instead of
+        querying, since the latest ones may not be written to database yet.
+        """
+        return list(cls._pools)
 
     @reconstructor
     def _init(self):
@@ -92,17 +190,37 @@ class Pool(SQLBase, GObject.GObject, LoggingMixin):
         self._categories = []
         self._dustbin = None
 
+        self._presentable_tasks = {}
+        self._task_presentables = {}
+
+        self._tasks_by_gid = {}
+        self._tasks_by_infohash = {}
+        self._task_index_keys = {}
+
         self._connected = False
+        self._connection_handle = None
+        self._global_options = None
         self._proxy = None
+        self._notifier = None
+        self._poller = StatusPoller(self, interval=self._UPDATE_INTERVAL,
+                                    batch_size=self._UPDATE_BATCH_SIZE)
 
+    def _start(self):
+        """Create the default category if missing, index the queuing tasks
+        and start connecting to the server.
+        """
         if self.default_category is None:
             self.logger.info('Creating default category for {}.'.format(self))
             down_dir = os.environ.get('XDG_DOWNLOAD_DIR', os.path.expanduser('~'))
             self.default_category = Category(name=_('My Downloads'),
                                              directory= down_dir,
                                              pool=self)
-            SQLSession.commit()
+            SQLCommitter.schedule()
 
+        for task in self.queuing.tasks:
+            self._index_task(task)
+
+        Pool._pools.append(self)
         self.do_disconnected()
         self._keep_connection()
 
@@ -114,9 +232,27 @@ class Pool(SQLBase, GObject.GObject, LoggingMixin):
         """Get the xmlrpc proxy of the pool."""
         if self._proxy is None:
             connstr = 'http://{0.user}:{0.passwd}@{0.host}:{0.port}/rpc'
-            self._proxy = ServerProxy(connstr.format(self))
+            self._proxy = ServerProxy(connstr.format(self),
+                                      pool_size=self._CONNECTION_POOL_SIZE,
+                                      queue_size=self._CALL_QUEUE_SIZE)
         return self._proxy
 
+    @property
+    def notifier(self):
+        """Get the websocket notifier of the pool."""
+        if self._notifier is None:
+            self._notifier = Notifier(self.host, self.port,
+                                      self.user, self.passwd)
+            self._notifier.connect('opened', self._on_notifier_opened)
+            self._notifier.connect('closed', self._on_notifier_closed)
+            self._notifier.connect('notification', self._on_notification)
+        return self._notifier
+
+    @property
+    def poller(self):
+        """Get the status poller of the pool."""
+        return self._poller
+
     @property
     def queuing(self):
         """Get the queuing presentable of the pool."""
@@ -136,11 +272,233 @@ class Pool(SQLBase, GObject.GObject, LoggingMixin):
         """Get the presentables of the pool."""
         return [self.queuing] + self.categories + [self.dustbin]
 
-    @hybrid_property
-    def tasks(self):
-        for category in self.categories:
-            for task in category._tasks:
-                yield task
+    def get_tasks(self, presentable):
+        """Get the tasks belonging to the presentable of the pool, in the
+        order they are added, with the L{TaskRecord}s promoted to L{Task}s
+        in bulk. Use L{get_records} when the fields of the records are
+        enough, so the tasks don't have to be loaded.
+        """
+        return self.promote_tasks(self.get_records(presentable))
+
+    def get_records(self, presentable):
+        """Get the tasks belonging to the presentable of the pool, in the
+        order they are added. Completed and removed tasks which are not
+        loaded are represented by L{TaskRecord}s.
+
+        The tasks are queried from database the first time, and kept in the
+        task set of the presentable since then, keyed by task id.
+        """
+        tasks = self._presentable_tasks.get(presentable)
+        if tasks is None:
+            # The database may not have the latest changes written yet, so
+            # the tasks filed in memory take precedence
+            tasks = OrderedDict()
+            for task in presentable.query_tasks():
+                if self._task_presentables.setdefault(
+                        task.id, (presentable, task))[0] is presentable:
+                    tasks[task.id] = self._task_presentables[task.id][1]
+            for (id_, (task_presentable, task)) in self._task_presentables.items():
+                if task_presentable is presentable:
+                    tasks[id_] = task
+            self._presentable_tasks[presentable] = tasks
+        return list(tasks.values())
+
+    def promote_task(self, task):
+        """Get the L{Task} of the L{TaskRecord}, and replace the record in
+        the task set with it. L{Task}s are returned as they are.
+        """
+        if isinstance(task, TaskRecord):
+            (presentable, record) = self._task_presentables[task.id]
+            if isinstance(record, TaskRecord):
+                record = record.promote()
+                self._task_presentables[task.id] = (presentable, record)
+                tasks = self._presentable_tasks.get(presentable)
+                if tasks is not None and task.id in tasks:
+                    tasks[task.id] = record
+            task = record
+        return task
+
+    def promote_tasks(self, tasks):
+        """Get the L{Task}s of the tasks, like L{promote_task}, loading the
+        L{TaskRecord}s in queries of L{_PROMOTE_BATCH_SIZE} tasks.
+        """
+        ids = [task.id for task in tasks if isinstance(task, TaskRecord)]
+        # Keep the loaded tasks referenced until they are promoted
+        loaded = []
+        for index in range(0, len(ids), self._PROMOTE_BATCH_SIZE):
+            loaded.extend(SQLSession.query(Task).filter(
+                Task.id.in_(ids[index:index + self._PROMOTE_BATCH_SIZE])))
+        return [self.promote_task(task) for task in tasks]
+
+    def empty_dustbin(self):
+        """Delete all the tasks in dustbin with one statement, and reset
+        the dustbin instead of removing the tasks one by one.
+        """
+        dustbin = self.dustbin
+        category_ids = [category.id for category in self.categories]
+        condition = Task.in_dustbin & Task.category_id.in_(category_ids)
+        SQLCommitter.execute(
+            TaskURI.__table__.delete().where(TaskURI.task_id.in_(
+                select([Task.id]).where(condition))),
+            Task.__table__.delete().where(condition))
+
+        for (id_, (presentable, task)) in list(self._task_presentables.items()):
+            if presentable is dustbin:
+                del self._task_presentables[id_]
+                if isinstance(task, Task):
+                    SQLSession.expunge(task)
+        self._presentable_tasks[dustbin] = OrderedDict()
+        dustbin.update_aggregates(-dustbin.task_count,
+                                  [-dustbin.total_length,
+                                   -dustbin.completed_length,
+                                   -dustbin.download_speed,
+                                   -dustbin.upload_speed])
+        dustbin.emit('tasks-reset')
+
+    def remove_category(self, category):
+        """Remove the category, moving all of its tasks to the default
+        category with one statement.
+        """
+        default_category = self.default_category
+        # Load the task sets before the tasks change in database
+        self.get_records(category)
+        self.get_records(default_category)
+        tasks = self._presentable_tasks.pop(category)
+        SQLCommitter.execute(
+            Task.__table__.update().where(
+                Task.category_id == category.id).values(
+                    category_id=default_category.id),
+            Category.__table__.delete().where(Category.id == category.id))
+
+        for task in list(SQLSession.identity_map.values()):
+            if isinstance(task, Task) and task.category_id == category.id:
+                set_committed_value(task, 'category', default_category)
+                set_committed_value(task, 'category_id', default_category.id)
+        for (id_, task) in tasks.items():
+            if isinstance(task, TaskRecord):
+                task.category_id = default_category.id
+            self._task_presentables[id_] = (default_category, task)
+        default_tasks = self._presentable_tasks[default_category]
+        default_tasks.update(tasks)
+        self._presentable_tasks[default_category] = \
+                OrderedDict(sorted(default_tasks.items()))
+        default_category.update_aggregates(category.task_count,
+                                           [category.total_length,
+                                            category.completed_length,
+                                            category.download_speed,
+                                            category.upload_speed])
+        default_category.emit('tasks-reset')
+
+        set_committed_value(self, 'categories', [
+            other for other in self.categories if other is not category])
+        # Expunging cascades through the task collection, which may be
+        # loaded with the tasks just moved to the default category
+        set_committed_value(category, '_tasks', [])
+        SQLSession.expunge(category)
+
+    def remove(self):
+        """Remove the pool with all of its categories and tasks, with one
+        statement for each table, and stop talking to the server.
+        """
+        if self._connection_handle is not None:
+            GLib.source_remove(self._connection_handle)
+            self._connection_handle = None
+        # Not emitting "disconnected", the tasks are removed anyway
+        self._connected = False
+        self.poller.stop()
+        if self._notifier is not None:
+            self._notifier.close()
+
+        category_ids = [category.id for category in self.categories]
+        condition = Task.category_id.in_(category_ids)
+        SQLCommitter.execute(
+            TaskURI.__table__.delete().where(TaskURI.task_id.in_(
+                select([Task.id]).where(condition))),
+            Task.__table__.delete().where(condition),
+            Category.__table__.delete().where(Category.pool_id == self.id),
+            Pool.__table__.delete().where(Pool.id == self.id))
+
+        for task in list(SQLSession.identity_map.values()):
+            if isinstance(task, Task) and task.category_id in category_ids:
+                SQLSession.expunge(task)
+        # Expunging cascades to the categories
+        SQLSession.expunge(self)
+        self._task_presentables.clear()
+        self._presentable_tasks.clear()
+        Pool._pools.remove(self)
+
+    def _file_task(self, task):
+        """Put the task into the task set of the presentable it belongs
+        to. Called when its state or category changed.
+        """
+        (old_presentable, old_task) = self._task_presentables.get(task.id,
+                                                                  (None, None))
+        new_presentable = task.presentable
+        if old_presentable is not new_presentable:
+            counters = task.counters
+            if old_presentable is not None:
+                self._presentable_tasks.get(old_presentable, {}).pop(task.id, None)
+                old_presentable.update_aggregates(
+                    -1, [-counter for counter in counters])
+            # Task sets not loaded yet will be queried from database
+            tasks = self._presentable_tasks.get(new_presentable)
+            if tasks is not None:
+                tasks[task.id] = task
+            new_presentable.update_aggregates(1, counters)
+            self._task_presentables[task.id] = (new_presentable, task)
+
+    def _unfile_task(self, task):
+        """Remove the task from the task sets, when it's removed."""
+        (presentable, old_task) = self._task_presentables.pop(task.id,
+                                                              (None, None))
+        if presentable is not None:
+            self._presentable_tasks.get(presentable, {}).pop(task.id, None)
+            presentable.update_aggregates(
+                -1, [-counter for counter in task.counters])
+
+    def _update_task_counters(self, task, old_counters):
+        """Apply the changes of the counters of the task to the aggregates
+        of the presentable it's filed in.
+        """
+        (presentable, old_task) = self._task_presentables.get(task.id,
+                                                              (None, None))
+        if presentable is not None:
+            presentable.update_aggregates(
+                0, [new - old for (new, old) in zip(task.counters, old_counters)])
+
+    def sync_tasks(self):
+        """Persist the durable status of the tasks in the queuing, which is
+        the only presentable whose tasks are updated.
+        """
+        for task in self.get_tasks(self.queuing):
+            task.sync_status()
+
+    def get_task_by_gid(self, gid):
+        """Get the queuing task with the given gid, or C{None}."""
+        return self._tasks_by_gid.get(gid)
+
+    def get_task_by_infohash(self, infohash):
+        """Get the queuing task with the given infohash, or C{None}."""
+        return self._tasks_by_infohash.get(infohash)
+
+    def _index_task(self, task):
+        """Index the task by its current gid and infohash. Called when
+        they are assigned or changed.
+        """
+        self._unindex_task(task)
+        if task.gid:
+            self._tasks_by_gid[task.gid] = task
+        if task.infohash:
+            self._tasks_by_infohash[task.infohash] = task
+        self._task_index_keys[task] = (task.gid, task.infohash)
+
+    def _unindex_task(self, task):
+        """Remove the task from the indexes, when it's no longer queuing."""
+        (gid, infohash) = self._task_index_keys.pop(task, (None, None))
+        if self._tasks_by_gid.get(gid) is task:
+            del self._tasks_by_gid[gid]
+        if self._tasks_by_infohash.get(infohash) is task:
+            del self._tasks_by_infohash[infohash]
 
     @property
     def connected(self):
@@ -160,7 +518,9 @@ class Pool(SQLBase, GObject.GObject, LoggingMixin):
     def do_connected(self):
         """When pool connected, try to resume last session."""
         self.logger.info('{}: connected.'.format(self))
-        self._resume_session()
+        self.notifier.open()
+        self._update_global_options()
+        self._reconcile()
 
     def do_disconnected(self):
         """When status changed, mark all queuing tasks as inactive.
@@ -170,6 +530,11 @@ class Pool(SQLBase, GObject.GObject, LoggingMixin):
         C{aria2.addUri}, or other method to add them as new tasks.
         """
         self.logger.info('{}: disconnected.'.format(self))
+        # The server may be restarted with other options
+        self._global_options = None
+        self.poller.stop()
+        if self._notifier is not None:
+            self._notifier.close()
         for task in self.queuing.tasks:
             task.state = 'inactive'
 
@@ -177,7 +542,16 @@ class Pool(SQLBase, GObject.GObject, LoggingMixin):
         """Keep calling C{aria2.getVersion} and mark pool as connected."""
 
         def on_got_version(deferred):
-            """When got aria2 version, mark the pool as connected."""
+            """When got aria2 version, mark the pool as connected, and try
+            to reopen the notifier if it's closed, unless the server doesn't
+            support websocket.
+            """
+            if self._connection_handle is None:
+                # The pool is removed
+                return
+            if self.connected and not self.notifier.running and \
+                    not self.notifier.refused:
+                self.notifier.open()
             self.connected = True
 
         deferred = self.proxy.call('aria2.getVersion')
@@ -185,33 +559,344 @@ class Pool(SQLBase, GObject.GObject, LoggingMixin):
         deferred.add_errback(self._on_xmlrpc_error)
         deferred.start()
 
-        GLib.timeout_add_seconds(self._CONNECTION_INTERVAL,
-                self._keep_connection)
+        self._connection_handle = GLib.timeout_add_seconds(
+                self._CONNECTION_INTERVAL, self._keep_connection)
         return False
 
-    def _resume_session(self):
-        """Get session id from pool."""
+    def get_option_overrides(self, options):
+        """Get the options which differ from the global options of the
+        server, the others are left for the server to apply. All of the
+        options are returned if the global options are not got yet.
+        """
+        global_options = self._global_options
+        if global_options is None:
+            return dict(options)
+        return dict((key, value) for (key, value) in options.items()
+                    if global_options.get(key) != value)
+
+    def _update_global_options(self):
+        """Get the global options of the server, which are cached until the
+        pool is disconnected, see L{get_option_overrides}.
+        """
+        def on_got_global_options(deferred):
+            """Cache the global options."""
+            self._global_options = deferred.result
 
-        def on_got_session_info(deferred):
-            """When got session info, call L{yaner.Task.begin_update_status}
-            on every task with the same session id.
-            """
-            session_info = deferred.result
-            for task in self.queuing.tasks:
-                if task.session_id == session_info['sessionId']:
-                    task.state = 'waiting'
-                    task.begin_update_status()
-
-        deferred = self.proxy.call('aria2.getSessionInfo')
-        deferred.add_callback(on_got_session_info)
+        deferred = self.proxy.call('aria2.getGlobalOption')
+        deferred.add_callback(on_got_global_options)
         deferred.add_errback(self._on_xmlrpc_error)
         deferred.start()
 
+    def _reconcile(self):
+        """Get all tasks held by the pool, page by page, in multicalls of
+        C{aria2.tellActive}, C{aria2.tellWaiting} and C{aria2.tellStopped},
+        then restore the state of the queuing tasks in one sweep.
+        """
+        page_size = self._RECONCILE_PAGE_SIZE
+        session_info = {}
+        statuses = {'aria2.tellActive': [],
+                    'aria2.tellWaiting': [],
+                    'aria2.tellStopped': [],
+                   }
+
+        def request(methods):
+            """Request the next pages of the given methods."""
+            calls = []
+            for method in methods:
+                if method == 'aria2.tellStopped':
+                    keys = StatusPoller.STATUS_KEYS
+                else:
+                    keys = self._RECONCILE_KEYS
+                if method == 'aria2.tellActive':
+                    params = [keys]
+                else:
+                    offset = len(statuses[method])
+                    params = [offset, page_size, keys]
+                calls.append({'methodName': method, 'params': params})
+            if not session_info:
+                calls.append({'methodName': 'aria2.getSessionInfo',
+                              'params': []})
+
+            deferred = self.proxy.call('system.multicall', calls)
+            deferred.add_callback(partial(on_got_pages, methods))
+            deferred.add_errback(self._on_xmlrpc_error)
+            deferred.start()
+
+        def on_got_pages(methods, deferred):
+            """Collect the pages, and request the next ones if any."""
+            for result in deferred.result:
+                if isinstance(result, dict):
+                    self.logger.warning('{}: reconciling failed: {}'.format(
+                        self, result['faultString']))
+                    return
+            if not session_info:
+                session_info.update(deferred.result[-1][0])
+
+            next_methods = []
+            for (method, result) in zip(methods, deferred.result):
+                statuses[method].extend(result[0])
+                if method != 'aria2.tellActive' and len(result[0]) == page_size:
+                    next_methods.append(method)
+
+            if next_methods:
+                request(next_methods)
+            else:
+                self._restore_tasks(session_info['sessionId'],
+                                    statuses['aria2.tellActive'] +
+                                    statuses['aria2.tellWaiting'],
+                                    statuses['aria2.tellStopped'])
+
+        request(list(statuses))
+
+    def _restore_tasks(self, session_id, running_statuses, stopped_statuses):
+        """Match the queuing tasks to the statuses got from the pool, and
+        update them with the statuses.
+
+        Tasks are matched by gid if they belong to the current session.
+        Otherwise, they are matched to the running tasks of the pool by
+        infohash or URI, to avoid adding them again.
+        """
+        statuses_by_gid = {}
+        statuses_by_source = {}
+        for status in running_statuses:
+            statuses_by_gid[status['gid']] = status
+            if 'infoHash' in status:
+                statuses_by_source.setdefault(status['infoHash'], status)
+            for file_ in status.get('files', []):
+                for uri in file_['uris']:
+                    statuses_by_source.setdefault(uri['uri'], status)
+        for status in stopped_statuses:
+            statuses_by_gid[status['gid']] = status
+
+        claimed_gids = set()
+        for task in list(self.queuing.tasks):
+            status = None
+            if task.session_id == session_id:
+                status = statuses_by_gid.get(task.gid)
+            if status is None:
+                sources = [task.infohash] + list(task.uris)
+                for source in sources:
+                    if source in statuses_by_source:
+                        status = statuses_by_source[source]
+                        break
+            if status is None or status['gid'] in claimed_gids:
+                continue
+
+            self.logger.info('{}: restoring {}.'.format(self, task))
+            claimed_gids.add(status['gid'])
+            task.gid = status['gid']
+            task.session_id = session_id
+            # The files are only got for matching, leave choosing the name
+            # to the first poll, which gets the whole status
+            task._update_status(dict((key, value) for (key, value)
+                                     in status.items() if key != 'files'))
+            if task.is_running:
+                task.begin_update_status()
+
+    def add_tasks(self, tasks):
+        """Add the new tasks to aria2, in multicalls of L{_ADD_BATCH_SIZE}
+        tasks, and show them in the queuing.
+        """
+        for index in range(0, len(tasks), self._ADD_BATCH_SIZE):
+            batch = tasks[index:index + self._ADD_BATCH_SIZE]
+            calls = []
+            for task in batch:
+                (method, params) = task._get_add_call()
+                calls.append({'methodName': method, 'params': params})
+            calls.append({'methodName': 'aria2.getSessionInfo', 'params': []})
+
+            deferred = self.proxy.call('system.multicall', calls)
+            deferred.add_callback(partial(self._on_tasks_added, batch))
+            deferred.add_errback(self._on_xmlrpc_error)
+            deferred.start()
+
+        for task in tasks:
+            self.queuing.add_task(task)
+
+    def _on_tasks_added(self, tasks, deferred):
+        """Assign the gids returned by aria2 to the tasks added."""
+        session_info = deferred.result[-1]
+        session_id = '' if isinstance(session_info, dict) else \
+                session_info[0]['sessionId']
+        for (task, result) in zip(tasks, deferred.result):
+            if isinstance(result, dict):
+                self.logger.warning('{}: adding {} failed: {}'.format(
+                    self, task, result['faultString']))
+                task.state = 'error'
+            else:
+                task._set_started(result[0])
+                task.session_id = session_id
+        SQLCommitter.schedule()
+        self.poller.start()
+
+    def start_tasks(self, tasks=None):
+        """Start or unpause the tasks in multicalls, or all the queuing
+        tasks with C{aria2.unpauseAll} if C{tasks} is C{None}.
+        """
+        queuing = tasks is None
+        if queuing:
+            tasks = self.queuing.tasks
+        addable_tasks = [task for task in tasks if task.is_addable]
+        unpausable_tasks = [task for task in tasks if task.is_unpausable]
+        if addable_tasks:
+            self.add_tasks(addable_tasks)
+        if queuing and unpausable_tasks:
+            self._call_all('aria2.unpauseAll', unpausable_tasks,
+                           Task._on_unpaused)
+        else:
+            self._call_tasks('aria2.unpause', unpausable_tasks,
+                             Task._on_unpaused)
+
+    def pause_tasks(self, tasks=None):
+        """Pause the tasks in multicalls, or all the queuing tasks with
+        C{aria2.pauseAll} if C{tasks} is C{None}.
+        """
+        queuing = tasks is None
+        if queuing:
+            tasks = self.queuing.tasks
+        pausable_tasks = [task for task in tasks if task.is_pausable]
+        if queuing and pausable_tasks:
+            self._call_all('aria2.pauseAll', pausable_tasks, Task._on_paused)
+        else:
+            self._call_tasks('aria2.pause', pausable_tasks, Task._on_paused)
+
+    def trash_tasks(self, tasks):
+        """Move the tasks to dustbin, removing the running ones from aria2
+        in multicalls.
+        """
+        tasks = [task for task in tasks if not task.is_trashed]
+        self._call_tasks('aria2.remove',
+                         [task for task in tasks if task.is_running],
+                         Task._on_trashed)
+        for task in tasks:
+            if not task.is_running:
+                task._on_trashed()
+        SQLCommitter.schedule()
+
+    def restore_tasks(self, tasks):
+        """Restore the tasks in dustbin, committed in one transaction."""
+        for task in tasks:
+            task.restore()
+        SQLCommitter.schedule()
+
+    def remove_tasks(self, tasks):
+        """Delete the tasks in dustbin with statements of
+        L{_REMOVE_BATCH_SIZE} tasks, and reset the dustbin instead of
+        removing the tasks one by one. The tasks can be L{TaskRecord}s.
+        """
+        dustbin = self.dustbin
+        ids = [task.id for task in tasks if task.in_dustbin]
+        if not ids:
+            return
+        statements = []
+        for index in range(0, len(ids), self._REMOVE_BATCH_SIZE):
+            batch = ids[index:index + self._REMOVE_BATCH_SIZE]
+            statements.append(TaskURI.__table__.delete().where(
+                TaskURI.task_id.in_(batch)))
+            statements.append(Task.__table__.delete().where(Task.id.in_(batch)))
+        SQLCommitter.execute(*statements)
+
+        dustbin_tasks = self._presentable_tasks.get(dustbin, {})
+        (task_count, counters) = (0, [0, 0, 0, 0])
+        for id_ in ids:
+            (presentable, task) = self._task_presentables.pop(id_, (None, None))
+            if presentable is None:
+                continue
+            dustbin_tasks.pop(id_, None)
+            task_count -= 1
+            counters = [counter - value for (counter, value) in zip(counters, (
+                task.total_length, task.completed_length,
+                task.download_speed, task.upload_speed))]
+            if isinstance(task, Task) and task in SQLSession:
+                SQLSession.expunge(task)
+        dustbin.update_aggregates(task_count, counters)
+        dustbin.emit('tasks-reset')
+
+    def _call_tasks(self, method, tasks, callback):
+        """Call the method with the gid of each task, in multicalls of
+        L{_OPERATION_BATCH_SIZE} tasks, and call the callback with each
+        task the call succeeded for.
+        """
+        for index in range(0, len(tasks), self._OPERATION_BATCH_SIZE):
+            batch = tasks[index:index + self._OPERATION_BATCH_SIZE]
+            calls = [{'methodName': method, 'params': [task.gid]}
+                     for task in batch]
+
+            deferred = self.proxy.call('system.multicall', calls)
+            deferred.add_callback(partial(self._on_tasks_called, batch,
+                                          callback))
+            deferred.add_errback(self._on_xmlrpc_error)
+            deferred.start()
+
+    def _call_all(self, method, tasks, callback):
+        """Call the method applying to all tasks of aria2, like
+        C{aria2.pauseAll}, and call the callback with each of the tasks.
+        """
+        def on_called(deferred):
+            """Apply the callback to the tasks."""
+            for task in tasks:
+                callback(task, None)
+            SQLCommitter.schedule()
+
+        deferred = self.proxy.call(method)
+        deferred.add_callback(on_called)
+        deferred.add_errback(self._on_xmlrpc_error)
+        deferred.start()
+
+    def _on_tasks_called(self, tasks, callback, deferred):
+        """Apply the callback to the tasks the calls succeeded for, and
+        commit the changes in one transaction.
+        """
+        for (task, result) in zip(tasks, deferred.result):
+            if isinstance(result, dict):
+                self.logger.warning('{}: operating {} failed: {}'.format(
+                    self, task, result['faultString']))
+            else:
+                callback(task, None)
+        SQLCommitter.schedule()
+
+    def _on_notifier_opened(self, notifier):
+        """When the notifier opened, task states are pushed by aria2."""
+        self.logger.info('{}: notifier opened.'.format(self))
+
+    def _on_notifier_closed(self, notifier):
+        """When the notifier closed, fall back to polling the state of all
+        running tasks, and refresh them for the missed notifications.
+        """
+        self.logger.info('{}: notifier closed.'.format(self))
+        if self.connected:
+            self.poller.start()
+            self.poller.poll([task for task in self.queuing.tasks
+                              if task.is_running])
+
+    def _on_notification(self, notifier, method, gid):
+        """Drive the task state by the notification of aria2."""
+        task = self.get_task_by_gid(gid)
+        if task is None:
+            return
+
+        self.logger.debug('{}: {} {}.'.format(self, method, task))
+        if method == 'aria2.onDownloadStart':
+            task.state = 'active'
+            self.poller.start()
+        elif method == 'aria2.onDownloadPause':
+            task.state = 'paused'
+        elif method == 'aria2.onDownloadError':
+            task.state = 'error'
+        else:
+            # Completed or stopped, get the whole status to check if the
+            # task is followed by others, and move it out of queuing
+            self.poller.poll([task])
+
     def _on_xmlrpc_error(self, deferred):
         """When we meet a xmlrpc error, it may be caused by network error,
-        mark the server as disconnected.
+        mark the server as disconnected. Calls failed because the queue is
+        full are just dropped.
 
         """
+        if deferred.overloaded:
+            # Already logged by the executor, the connection is fine
+            return
         self.connected = False
 
 GObject.type_register(Pool)
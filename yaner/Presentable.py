@@ -29,8 +29,8 @@ from sqlalchemy import Column, Integer, Unicode, ForeignKey
 from sqlalchemy.orm import reconstructor, relationship
 from sqlalchemy.ext.hybrid import hybrid_property
 
-from yaner.Task import Task
-from yaner.Database import SQLSession, SQLBase
+from yaner.Task import Task, TaskRecord
+from yaner.Database import SQLSession, SQLBase, SQLCommitter
 from yaner.utils.Enum import Enum
 from yaner.utils.Logging import LoggingMixin
 
@@ -43,6 +43,7 @@ class Presentable(LoggingMixin, GObject.GObject):
             'changed': (GObject.SignalFlags.RUN_LAST, None, ()),
             'task-added': (GObject.SignalFlags.RUN_LAST, None, (Task,)),
             'task-removed': (GObject.SignalFlags.RUN_LAST, None, (Task,)),
+            'tasks-reset': (GObject.SignalFlags.RUN_LAST, None, ()),
             }
     """
     GObject signals of this class.
@@ -55,9 +56,22 @@ class Presentable(LoggingMixin, GObject.GObject):
         LoggingMixin.__init__(self)
         GObject.GObject.__init__(self)
 
+        self.task_count = 0
+        self.total_length = 0
+        self.completed_length = 0
+        self.download_speed = 0
+        self.upload_speed = 0
+
     def __repr__(self):
         return '<{}>'.format(self.name)
 
+    @property
+    def records(self):
+        """Get the tasks of the presentable, with the completed and removed
+        ones which are not loaded represented by L{TaskRecord}s.
+        """
+        return self.pool.get_records(self)
+
     def add_task(self, task):
         """When task added, emit signals."""
         self.emit('changed')
@@ -68,6 +82,24 @@ class Presentable(LoggingMixin, GObject.GObject):
         self.emit('changed')
         self.emit('task-removed', task)
 
+    def update_aggregates(self, task_count, counters):
+        """Add the deltas to the aggregates of the tasks, emit "changed" if
+        the task count or total length, which are shown, changed.
+
+        @arg task_count:Delta of the number of tasks.
+        @type task_count:L{int}
+        @arg counters:Deltas of total length, completed length, download
+        speed and upload speed.
+        @type counters:C{tuple}
+        """
+        self.task_count += task_count
+        self.total_length += counters[0]
+        self.completed_length += counters[1]
+        self.download_speed += counters[2]
+        self.upload_speed += counters[3]
+        if task_count or counters[0]:
+            self.emit('changed')
+
 class Queuing(Presentable):
     """
     Queuing presentable of the L{Pool}s.
@@ -100,7 +132,12 @@ class Queuing(Presentable):
     @property
     def tasks(self):
         """Get the running tasks of the pool."""
-        return (task for task in self.pool.tasks if task.in_queuing)
+        return self.pool.get_tasks(self)
+
+    def query_tasks(self):
+        """Query the running tasks of the pool from database."""
+        return SQLSession.query(Task).join(Task.category).filter(
+            Category.pool_id == self.pool.id, Task.in_queuing).order_by(Task.id)
 
 class Category(SQLBase, Presentable):
     """
@@ -121,8 +158,8 @@ class Category(SQLBase, Presentable):
         self.directory = directory
         self.pool = pool
 
-        SQLSession.add(self)
-        SQLSession.commit()
+        SQLCommitter.add(self)
+        SQLCommitter.schedule()
 
         self._init()
 
@@ -130,11 +167,16 @@ class Category(SQLBase, Presentable):
     def _init(self):
         Presentable.__init__(self)
 
-        self.parent = self.pool.queuing
-
     def __repr__(self):
         return _("<Category {}>").format(self.name)
 
+    @property
+    def parent(self):
+        """Get the parent presentable, which is the queuing of the pool. The
+        pool may not be initialized yet when the category is loaded.
+        """
+        return self.pool.queuing
+
     @hybrid_property
     def name(self):
         return self._name_
@@ -146,9 +188,31 @@ class Category(SQLBase, Presentable):
         if hash(self):
             self.emit('changed')
 
-    @hybrid_property
+    @property
     def tasks(self):
-        return (task for task in self._tasks if task.in_category)
+        """Get the completed tasks of the category, all loaded. Use L{records} if
+        the fields of the tasks are enough.
+        """
+        return self.pool.get_tasks(self)
+
+    def query_tasks(self):
+        """Query the records of the completed tasks of the category from
+        database.
+        """
+        return TaskRecord.load(SQLSession.query(Task).filter(
+            Task.category_id == self.id, Task.in_category).order_by(Task.id))
+
+    def add_tasks(self, tasks):
+        """Create tasks in the category in a single transaction, and add
+        them to aria2 in bulk.
+
+        @arg tasks:Keyword arguments of L{Task} of each task, except
+        C{category}.
+        @type tasks:C{list} of C{dict}
+        """
+        tasks = Task.create_many(self, tasks)
+        self.pool.add_tasks(tasks)
+        return tasks
 
 class Dustbin(Presentable):
     """
@@ -178,6 +242,15 @@ class Dustbin(Presentable):
 
     @property
     def tasks(self):
-        """Get the removed tasks of the pool."""
-        return (task for task in self.pool.tasks if task.in_dustbin)
+        """Get the removed tasks of the pool, all loaded. Use L{records} if
+        the fields of the tasks are enough.
+        """
+        return self.pool.get_tasks(self)
+
+    def query_tasks(self):
+        """Query the records of the removed tasks of the pool from
+        database.
+        """
+        return TaskRecord.load(SQLSession.query(Task).join(Task.category).filter(
+            Category.pool_id == self.pool.id, Task.in_dustbin).order_by(Task.id))
 
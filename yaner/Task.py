@@ -25,19 +25,88 @@ This module contains the L{Task} class of L{yaner}.
 """
 
 import os
+import pickle
+import hashlib
 
-from gi.repository import GLib
 from gi.repository import GObject
-from sqlalchemy import Column, Integer, PickleType, Unicode, ForeignKey
-from sqlalchemy.orm import reconstructor, deferred
+from sqlalchemy import Column, Integer, BigInteger, PickleType, Unicode, ForeignKey
+from sqlalchemy import select, bindparam, text
+from sqlalchemy.orm import reconstructor, relationship
 from sqlalchemy.ext.hybrid import hybrid_property
 
 from yaner.Misc import unquote
-from yaner.Database import SQLBase, SQLSession
+from yaner.BlobStore import Blobs
+from yaner.Database import SQLBase, SQLSession, SQLCommitter
 from yaner.utils.Logging import LoggingMixin
 from yaner.utils.MutationDict import MutationDict
 from yaner.utils.Notification import Notification
 
+class OptionProfile(SQLBase):
+    """
+    A set of aria2 options stored once, and shared by all the tasks created
+    with the same options, which is looked up by the digest of the options.
+    The options of a profile never change, tasks are changed to another
+    profile instead.
+    """
+
+    digest = Column(Unicode, index=True, unique=True)
+    options = Column(PickleType)
+
+    _profiles = {}
+    """The profiles got by L{get}, keyed by digest."""
+
+    def __init__(self, digest, options):
+        self.digest = digest
+        self.options = options
+
+    def __repr__(self):
+        return _("<OptionProfile {}>").format(self.id)
+
+    @staticmethod
+    def get_digest(options):
+        """Get the digest of the options, which doesn't depend on the order
+        of the keys.
+        """
+        return hashlib.sha256(
+            repr(sorted(options.items())).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def get(cls, options):
+        """Get the profile of the options, which is created if there isn't
+        one yet.
+        """
+        options = dict(options)
+        digest = cls.get_digest(options)
+        profile = cls._profiles.get(digest)
+        if profile is None:
+            profile = SQLSession.query(cls).filter(cls.digest == digest).first()
+            if profile is None:
+                profile = cls(digest, options)
+                SQLCommitter.add(profile)
+            cls._profiles[digest] = profile
+        return profile
+
+    @classmethod
+    def collect(cls):
+        """Delete the profiles not used by any task."""
+        SQLCommitter.execute(cls.__table__.delete().where(~cls.id.in_(
+            select([Task.profile_id]).where(Task.profile_id != None))))
+        cls._profiles.clear()
+
+class TaskURI(SQLBase):
+    """
+    An URI of a L{Task}, one row for each of them, so mirror lists don't
+    have to be pickled with the task.
+    """
+
+    task_id = Column(Integer, ForeignKey('task.id'), index=True)
+    position = Column(Integer)
+    uri = Column(Unicode)
+
+    def __init__(self, position, uri):
+        self.position = position
+        self.uri = uri
+
 class Task(SQLBase, GObject.GObject, LoggingMixin):
     """
     Task class is just downloading tasks, which provides data to L{TaskListModel}.
@@ -48,39 +117,49 @@ class Task(SQLBase, GObject.GObject, LoggingMixin):
             }
     """GObject signals of this class."""
 
-    _UPDATE_INTERVAL = 1
-    """Interval for status updating, in second(s)."""
+    _DURABLE_FIELDS = ('infoHash', 'bittorrent')
+    """Fields of the runtime status which are persisted into L{status} by
+    L{sync_status}, the lengths are persisted into their own columns, and
+    the gid and state are persisted when set.
+    """
 
-    _DEFAULT_STATUS = {
-        'completedLength': '0',
-        'totalLength': '0',
-        'downloadSpeed': '0',
-        'uploadSpeed': '0',
-        'connections': '0',
-        'gid': '',
-        'status': 'inactive',
-    }
-    """Default task status."""
+    _RENDERED_FIELDS = ('status', 'completedLength', 'totalLength',
+                        'downloadSpeed', 'uploadSpeed', 'connections', 'gid')
+    """Status fields which are rendered or persisted, a change of any of them
+    makes the task emit the C{'changed'} signal.
+    """
 
     name = Column(Unicode)
     status = Column(MutationDict.as_mutable(PickleType))
 
-    uris = Column(PickleType, default=[])
-    torrent = deferred(Column(PickleType, default=None))
-    metafile = deferred(Column(PickleType, default=None))
+    _state = Column('state', Unicode, default='inactive', index=True)
+    _gid = Column('gid', Unicode, default='', index=True)
+    _total_length = Column('total_length', BigInteger, default=0)
+    _completed_length = Column('completed_length', BigInteger, default=0)
+
+    _uris = relationship(TaskURI, backref='task', order_by=TaskURI.position,
+                         cascade='all, delete-orphan')
+    torrent_hash = Column(Unicode, default=None)
+    metafile_hash = Column(Unicode, default=None)
 
-    options = Column(MutationDict.as_mutable(PickleType))
+    profile_id = Column(Integer, ForeignKey('optionprofile.id'), index=True)
+    profile = relationship(OptionProfile)
     session_id = Column(Unicode, default='')
-    category_id = Column(Integer, ForeignKey('category.id'))
+    category_id = Column(Integer, ForeignKey('category.id'), index=True)
 
     def __init__(self, name, category, options, uris=[],
-                 torrent=None, metafile=None):
+                 torrent=None, metafile=None, commit=True):
         self.name = name
-        self.status = Task._DEFAULT_STATUS
+        self.status = {}
+        self._state = 'inactive'
+        self._gid = ''
+        self._total_length = 0
+        self._completed_length = 0
 
-        self.uris = uris
-        self.torrent = torrent
-        self.metafile = metafile
+        self._uris = [TaskURI(position, uri)
+                      for (position, uri) in enumerate(uris)]
+        self.torrent_hash = None if torrent is None else Blobs.put(torrent)
+        self.metafile_hash = None if metafile is None else Blobs.put(metafile)
 
         self.options = options
         self.category = category
@@ -89,21 +168,149 @@ class Task(SQLBase, GObject.GObject, LoggingMixin):
         self.logger.info('Adding new task: {}...'.format(self))
         self.logger.debug('Task options: {}'.format(options))
 
-        SQLSession.add(self)
-        SQLSession.commit()
+        SQLCommitter.add(self)
+        for task_uri in self._uris:
+            SQLCommitter.add(task_uri)
+        if commit:
+            SQLCommitter.commit()
 
         self._init()
+        self.pool._file_task(self)
+
+    @classmethod
+    def create_many(cls, category, tasks):
+        """Create tasks in the category, which are committed in a single
+        transaction, and return them.
+
+        @arg tasks:Keyword arguments of L{Task} of each task, except
+        C{category}.
+        @type tasks:C{list} of C{dict}
+        """
+        tasks = [cls(category=category, commit=False, **kwargs)
+                 for kwargs in tasks]
+        SQLCommitter.commit()
+        return tasks
 
     @reconstructor
     def _init(self):
         LoggingMixin.__init__(self)
         GObject.GObject.__init__(self)
 
-        self._status_update_handle = None
-        self._database_sync_handle = None
-
         self._name_fixed = False
 
+        self._runtime_status = {}
+
+        self.changed_fields = frozenset()
+        """Fields changed since the last C{'changed'} signal emitted, which
+        are keys of the status got from aria2 and C{'name'}.
+        """
+
+    @classmethod
+    def __upgrade__(cls, connection, columns):
+        """Fill the columns added to the database file created by an older
+        version, with the fields they replace in the pickled status, the
+        torrent and metalink files moved out of the database, and the
+        options and URIs moved to their own tables.
+        """
+        if 'torrent_hash' in columns:
+            cls._upgrade_blobs(connection)
+        if 'profile_id' in columns:
+            cls._upgrade_options(connection)
+        if 'state' not in columns:
+            return
+        table = cls.__table__
+        params = []
+        for (id_, status) in connection.execute(
+                select([table.c.id, table.c.status])):
+            status = dict(status or {})
+            params.append({
+                'id_': id_,
+                'state': status.pop('status', 'inactive'),
+                'gid': status.pop('gid', ''),
+                'total_length': int(status.pop('totalLength', 0)),
+                'completed_length': int(status.pop('completedLength', 0)),
+                'status': dict((key, status[key]) for key in cls._DURABLE_FIELDS
+                               if key in status),
+                })
+        if params:
+            connection.execute(
+                table.update().where(table.c.id == bindparam('id_')).values(
+                    state=bindparam('state'), gid=bindparam('gid'),
+                    total_length=bindparam('total_length'),
+                    completed_length=bindparam('completed_length'),
+                    status=bindparam('status')),
+                params)
+
+    @classmethod
+    def _upgrade_blobs(cls, connection):
+        """Move the pickled torrent and metalink files into L{Blobs}, and
+        clear the columns which held them.
+        """
+        table = cls.__table__
+        params = []
+        for (id_, torrent, metafile) in connection.execute(text(
+                'SELECT id, torrent, metafile FROM task '
+                'WHERE torrent IS NOT NULL OR metafile IS NOT NULL')):
+            (torrent, metafile) = (None if value is None else
+                                   Blobs.put(pickle.loads(value).data)
+                                   for value in (torrent, metafile))
+            params.append({'id_': id_, 'torrent_hash': torrent,
+                           'metafile_hash': metafile})
+        if params:
+            connection.execute(
+                table.update().where(table.c.id == bindparam('id_')).values(
+                    torrent_hash=bindparam('torrent_hash'),
+                    metafile_hash=bindparam('metafile_hash')),
+                params)
+            connection.execute(text(
+                'UPDATE task SET torrent = NULL, metafile = NULL'))
+
+    @classmethod
+    def _upgrade_options(cls, connection):
+        """Move the pickled options into shared L{OptionProfile}s and the
+        pickled URIs into L{TaskURI}s, and clear the columns which held
+        them.
+        """
+        table = cls.__table__
+        profiles = {}
+        params = []
+        uri_params = []
+        for (id_, uris, options) in connection.execute(text(
+                'SELECT id, uris, options FROM task')):
+            options = {} if options is None else dict(pickle.loads(options))
+            digest = OptionProfile.get_digest(options)
+            if digest not in profiles:
+                profiles[digest] = {'id': len(profiles) + 1, 'digest': digest,
+                                    'options': options}
+            params.append({'id_': id_, 'profile_id': profiles[digest]['id']})
+            for (position, uri) in enumerate(
+                    [] if uris is None else pickle.loads(uris)):
+                uri_params.append({'task_id': id_, 'position': position,
+                                   'uri': uri})
+        if profiles:
+            connection.execute(OptionProfile.__table__.insert(),
+                               list(profiles.values()))
+        if params:
+            connection.execute(
+                table.update().where(table.c.id == bindparam('id_')).values(
+                    profile_id=bindparam('profile_id')),
+                params)
+            connection.execute(text(
+                'UPDATE task SET uris = NULL, options = NULL'))
+        if uri_params:
+            connection.execute(TaskURI.__table__.insert(), uri_params)
+
+    @classmethod
+    def query_blobs(cls):
+        """Query the digests of the torrent and metalink files of all tasks,
+        which are kept by L{Blobs}.
+        """
+        for row in SQLSession.query(cls.torrent_hash, cls.metafile_hash).filter(
+                (cls.torrent_hash != None) | (cls.metafile_hash != None)):
+            for digest in row:
+                if digest is not None:
+                    yield digest
+
     def __repr__(self):
         return _("<Task {}>").format(self.name)
 
@@ -111,27 +318,64 @@ class Task(SQLBase, GObject.GObject, LoggingMixin):
     def pool(self):
         return self.category.pool
 
+    @property
+    def uris(self):
+        """The URIs of the task."""
+        return [task_uri.uri for task_uri in self._uris]
+
+    @property
+    def options(self):
+        """A copy of the options of the task, assign a new dict to change
+        them.
+        """
+        return dict(self.profile.options)
+
+    @options.setter
+    def options(self, options):
+        """Set the options, by changing the L{OptionProfile} of the task."""
+        self.profile = OptionProfile.get(options)
+
     @hybrid_property
     def state(self):
         """Download status of the task, must be one of: 'inactive', 'active',
         'paused', 'waiting', 'complete', 'removed', 'error'.
         """
-        return self.status['status']
+        return self._state
 
     @state.setter
     def state(self, state):
-        """Always sync when task state changes."""
-        if hash(self) and self.state != state:
-            self.status['status'] = state
-            SQLSession.commit()
-            self.emit('changed')
-        else:
-            self.status['status'] = state
+        """Always sync when task state changes, and move the task to the
+        task set of the presentable it belongs to.
+        """
+        if self._set_state(state):
+            self._emit_changed(['status'])
+
+    def _set_state(self, state):
+        """Set the state without emitting signals, return C{True} if the state
+        of a persisted task is changed.
+        """
+        if self.state != state:
+            self._state = state
+            if hash(self):
+                self.sync_status()
+                self.pool._file_task(self)
+                SQLCommitter.schedule()
+                return True
+        return False
+
+    def _emit_changed(self, fields):
+        """Emit the C{'changed'} signal with L{changed_fields} set to C{fields}."""
+        self.changed_fields = frozenset(fields)
+        self.emit('changed')
 
     @hybrid_property
     def in_queuing(self):
         return self.state not in ['complete', 'removed']
 
+    @in_queuing.expression
+    def in_queuing(cls):
+        return ~cls._state.in_(['complete', 'removed'])
+
     @hybrid_property
     def in_category(self):
         return self.state == 'complete'
@@ -141,37 +385,70 @@ class Task(SQLBase, GObject.GObject, LoggingMixin):
         return self.state == 'removed'
 
     @property
+    def presentable(self):
+        """The presentable the task belongs to according to its state."""
+        if self.in_queuing:
+            return self.pool.queuing
+        elif self.in_category:
+            return self.category
+        else:
+            return self.pool.dustbin
+
+    @hybrid_property
     def gid(self):
-        return self.status['gid']
+        return self._gid
 
     @gid.setter
     def gid(self, gid):
-        self.status['gid'] = gid
+        self._gid = gid
+        self.pool._index_task(self)
+
+    @property
+    def infohash(self):
+        """The infohash of the task if it uses bittorrent, or C{None}."""
+        return self._get_status('infoHash')
 
     @property
     def total_length(self):
-        return int(self.status['totalLength'])
+        return int(self._runtime_status.get('totalLength', self._total_length))
 
     @property
     def completed_length(self):
-        return int(self.status['completedLength'])
+        return int(self._runtime_status.get('completedLength',
+                                            self._completed_length))
 
     @property
     def download_speed(self):
-        return int(self.status['downloadSpeed'])
+        return int(self._runtime_status.get('downloadSpeed', 0))
 
     @property
     def upload_speed(self):
-        return int(self.status['uploadSpeed'])
+        return int(self._runtime_status.get('uploadSpeed', 0))
 
     @property
     def connections(self):
-        return int(self.status['connections'])
+        return int(self._runtime_status.get('connections', 0))
+
+    @property
+    def counters(self):
+        """The counters summed up by the presentables, which are total
+        length, completed length, download speed and upload speed.
+        """
+        return (self.total_length, self.completed_length,
+                self.download_speed, self.upload_speed)
 
     @property
     def has_bittorrent(self):
         """Check if task use bittorrent protocol."""
-        return 'bittorrent' in self.status
+        return self._get_status('bittorrent') is not None
+
+    @property
+    def wants_details(self):
+        """Check if the heavy fields of the status, like C{files}, should be
+        fetched in the next status update, which is until the name of the
+        task is chosen from them.
+        """
+        return not self._name_fixed
 
     @property
     def is_completed(self):
@@ -209,17 +486,24 @@ class Task(SQLBase, GObject.GObject, LoggingMixin):
         """Check if task is unpausable."""
         return self.state == 'paused'
 
+    def _get_add_call(self):
+        """Get the method name and params adding the task to aria2, with
+        only the options differing from the global options of the pool.
+        """
+        options = self.pool.get_option_overrides(self.profile.options)
+        if self.metafile_hash:
+            return ('aria2.addMetalink',
+                    [Blobs.open_binary(self.metafile_hash), options])
+        elif self.torrent_hash:
+            return ('aria2.addTorrent',
+                    [Blobs.open_binary(self.torrent_hash), self.uris, options])
+        else:
+            return ('aria2.addUri', [self.uris, options])
+
     def add(self):
         """Add the task to pool."""
-        proxy = self.pool.proxy
-        options = dict(self.options)
-        if self.metafile:
-            deferred = proxy.call('aria2.addMetalink', self.metafile, options)
-        elif self.torrent:
-            deferred = proxy.call('aria2.addTorrent', self.torrent,
-                                  self.uris, options)
-        else:
-            deferred = proxy.call('aria2.addUri', self.uris, options)
+        (method, params) = self._get_add_call()
+        deferred = self.pool.proxy.call(method, *params)
 
         deferred.add_callback(self._on_started)
         deferred.add_errback(self._on_xmlrpc_error)
@@ -270,31 +554,26 @@ class Task(SQLBase, GObject.GObject, LoggingMixin):
         """Remove task."""
         if self.is_trashed:
             self.pool.dustbin.remove_task(self)
+            self.pool._unfile_task(self)
             SQLSession.delete(self)
-            SQLSession.commit()
+            SQLCommitter.schedule()
 
     def begin_update_status(self):
         """Begin to update status every second. Task must be marked
         waiting before calling this.
+
+        The status of all running tasks of the pool is polled by the
+        L{StatusPoller<yaner.Poller.StatusPoller>} of the pool, this
+        just makes sure the poller is running.
         """
-        if self._status_update_handle is None:
-            self.logger.info('{}: begin updating status.'.format(self))
-            self._status_update_handle = GLib.timeout_add_seconds(
-                    self._UPDATE_INTERVAL, self._call_tell_status)
-
-    def end_update_status(self):
-        """Stop updating status every second."""
-        if self._status_update_handle:
-            self.logger.info('{}: end updating status.'.format(self))
-            GLib.source_remove(self._status_update_handle)
-            self._status_update_handle = None
+        self.pool.poller.start()
 
     def _update_session_id(self):
         """Get session id of the pool and store it in task."""
         def on_got_session_info(deferred):
             """Set session id the task belongs to."""
             self.session_id = deferred.result['sessionId']
-            SQLSession.commit()
+            SQLCommitter.schedule()
 
         deferred = self.pool.proxy.call('aria2.getSessionInfo', self.gid)
         deferred.add_callback(on_got_session_info)
@@ -304,13 +583,18 @@ class Task(SQLBase, GObject.GObject, LoggingMixin):
     def _on_started(self, deferred):
         """Task started callback, update task information."""
 
-        gid = deferred.result
-        self.gid = gid[-1] if isinstance(gid, list) else gid
-        self.state = 'active'
+        self._set_started(deferred.result)
 
         self._update_session_id()
         self.begin_update_status()
 
+    def _set_started(self, gid):
+        """Set the gid returned by aria2 when the task is added, which is a
+        list of gids for metalinks.
+        """
+        self.gid = gid[-1] if isinstance(gid, list) else gid
+        self.state = 'active'
+
     def _on_paused(self, deferred):
         """Task paused callback, update state."""
         self.state = 'paused'
@@ -325,56 +609,63 @@ class Task(SQLBase, GObject.GObject, LoggingMixin):
         """
         in_category = self.in_category
         self.state = 'removed'
+        self.pool._unindex_task(self)
         if in_category:
             self.category.remove_task(self)
         else:
             self.pool.queuing.remove_task(self)
         self.pool.dustbin.add_task(self)
 
-    def _call_tell_status(self):
-        """Call pool for the status of this task.
-
-        Return True to keep calling this when timeout else stop.
-
+    def _update_status(self, status):
+        """Update data fields of the task with the status got from the
+        L{StatusPoller<yaner.Poller.StatusPoller>}, which may only contain
+        part of the fields.
         """
-        if self.is_running:
-            deferred = self.pool.proxy.call('aria2.tellStatus', self.gid)
-            deferred.add_callback(self._update_status)
-            deferred.add_errback(self._on_xmlrpc_error)
-            deferred.start()
-            return True
-        else:
-            self.end_update_status()
-            return False
-
-    def _update_status(self, deferred):
-        """Update data fields of the task."""
-        status = deferred.result
-
-        # Choose the best task name
-        if not self._name_fixed:
-            self._name_fixed = True
-            if self.has_bittorrent:
-                name = unquote(status['bittorrent']['info']['name'])
-                if name != '':
-                    self.name = name
-            else:
-                files = status['files']
-                if len(files) == 1:
-                    name = unquote(os.path.basename(files[0]['path']))
+        changed_fields = set(key for key in Task._RENDERED_FIELDS
+                             if key in status and key != 'status' and
+                             status[key] != self._runtime_status.get(key))
+        old_name = self.name
+
+        if 'files' in status:
+            # Choose the best task name
+            if not self._name_fixed:
+                self._name_fixed = True
+                if 'bittorrent' in status:
+                    name = unquote(status['bittorrent']['info']['name'])
                     if name != '':
                         self.name = name
-
-        self.status = status
-        # If state changed, set task changed and commit to database
-        self.state = status['status']
+                else:
+                    files = status['files']
+                    if len(files) == 1:
+                        name = unquote(os.path.basename(files[0]['path']))
+                        if name != '':
+                            self.name = name
+        if self.name != old_name:
+            changed_fields.add('name')
+
+        infohash = self.infohash
+        runtime_status = dict(self._runtime_status)
+        runtime_status.update(status)
+        # State is persisted in its column directly
+        runtime_status.pop('status')
+        self._set_runtime_status(runtime_status)
+        if self.infohash != infohash:
+            self.pool._index_task(self)
+        # If state changed, commit to database
+        if self._set_state(status['status']):
+            changed_fields.add('status')
+
+        if changed_fields:
+            self._emit_changed(changed_fields)
 
         if self.is_completed:
             # If we are following a torrent or a metafile
             followedBy = status.get('followedBy', None)
             belongsTo = status.get('belongsTo', None)
             if followedBy or belongsTo:
-                self.status = Task._DEFAULT_STATUS
+                self.status = {}
+                self._total_length = self._completed_length = 0
+                self._set_runtime_status({})
                 # The metafile task is followed by the torrent task and the
                 # metalink task, and the torrent task belongs to the metalink task
                 self.gid = followedBy[0] if followedBy else belongsTo
@@ -382,21 +673,106 @@ class Task(SQLBase, GObject.GObject, LoggingMixin):
                 self._name_fixed = False
                 self.begin_update_status()
             else:
+                self.pool._unindex_task(self)
                 self.pool.queuing.remove_task(self)
                 self.category.add_task(self)
         elif self.is_trashed:
             # Necessary?
             return self._on_trashed()
-        else:
-            self.emit('changed')
 
-        self.pool.connected = True
+    def _get_status(self, key, default=None):
+        """Get a field of the status, from the runtime status if the task
+        has been updated since started, or from the persisted L{status}.
+        """
+        return self._runtime_status.get(key, self.status.get(key, default))
+
+    def _set_runtime_status(self, status):
+        """Replace the runtime status, and update the aggregates of the
+        presentable the task belongs to. The runtime status is never flushed
+        to database, see L{sync_status}.
+        """
+        old_counters = self.counters
+        self._runtime_status = status
+        self.pool._update_task_counters(self, old_counters)
+
+    def sync_status(self):
+        """Copy the lengths and the durable fields of the runtime status into
+        the columns, so they are persisted in the next commit. Called when
+        the state of the task changes, and periodically by the application.
+        """
+        if self._total_length != self.total_length:
+            self._total_length = self.total_length
+        if self._completed_length != self.completed_length:
+            self._completed_length = self.completed_length
+
+        durable_status = dict((key, self._runtime_status[key])
+                              for key in Task._DURABLE_FIELDS
+                              if key in self._runtime_status)
+        if any(self.status.get(key) != value
+               for (key, value) in durable_status.items()):
+            status = dict(self.status)
+            status.update(durable_status)
+            self.status = status
 
     def _on_xmlrpc_error(self, deferred):
         """Handle errors occured when calling some function via xmlrpc."""
+        if deferred.overloaded:
+            # Already logged by the executor, the connection is fine
+            return
         self.state = 'error'
         message = getattr(deferred.error, 'message', str(deferred.error))
         Notification(_('Network Error'), message).show()
 
 GObject.type_register(Task)
 
+class TaskRecord(object):
+    """
+    Lightweight read-only record of a completed or removed task, which
+    provides data to L{TaskListModel} without loading the task as a L{Task}
+    GObject. Call L{promote} to get the L{Task} to act on it.
+    """
+
+    __slots__ = ('id', 'name', 'state', 'total_length', 'completed_length',
+                 'category_id')
+
+    download_speed = 0
+    upload_speed = 0
+    connections = 0
+
+    def __init__(self, id_, name, state, total_length, completed_length,
+                 category_id):
+        self.id = id_
+        self.name = name
+        self.state = state
+        self.total_length = total_length
+        self.completed_length = completed_length
+        self.category_id = category_id
+
+    def __repr__(self):
+        return _("<Task {}>").format(self.name)
+
+    @classmethod
+    def load(cls, query):
+        """Load the records of the tasks selected by the query of L{Task}s,
+        without loading the tasks.
+        """
+        return [cls(*row) for row in query.with_entities(
+            Task.id, Task.name, Task.state, Task._total_length,
+            Task._completed_length, Task.category_id)]
+
+    @property
+    def in_category(self):
+        return self.state == 'complete'
+
+    @property
+    def in_dustbin(self):
+        return self.state == 'removed'
+
+    @property
+    def is_active(self):
+        """Check if task is active."""
+        return False
+
+    def promote(self):
+        """Get the L{Task} of the record, loading it if necessary."""
+        return SQLSession.query(Task).get(self.id)
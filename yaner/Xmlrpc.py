@@ -22,6 +22,9 @@
 
 """This module contains async xmlrpc proxy."""
 
+import time
+import queue
+import errno
 import socket
 import http.client
 import xmlrpc.client
@@ -31,7 +34,9 @@ from functools import partial
 from gi.repository import GLib
 from gi.repository import GObject
 
-class _Deferred(threading.Thread, GObject.GObject):
+from yaner.utils.Logging import LoggingMixin
+
+class _Deferred(GObject.GObject):
 
     __gsignals__ = {
             'success': (GObject.SignalFlags.RUN_LAST, None, ()),
@@ -39,10 +44,10 @@ class _Deferred(threading.Thread, GObject.GObject):
             'error': (GObject.SignalFlags.RUN_LAST, None, ()),
             }
 
-    def __init__(self, target, args=(), kwargs=None):
-        threading.Thread.__init__(self)
+    def __init__(self, executor, target, args=(), kwargs=None):
         GObject.GObject.__init__(self)
 
+        self.executor = executor
         self.target = target
         self.args = args
         self.kwargs = kwargs if kwargs else {}
@@ -51,6 +56,13 @@ class _Deferred(threading.Thread, GObject.GObject):
         self.fault = None
         self.error = None
 
+    @property
+    def overloaded(self):
+        """Check if the call failed because too many calls were waiting for
+        the workers, which says nothing about the connection to the server.
+        """
+        return isinstance(self.error, queue.Full)
+
     def add_callback(self, func):
         """Connect signal "success" to func."""
         self.connect("success", partial(GLib.idle_add, func))
@@ -66,6 +78,12 @@ class _Deferred(threading.Thread, GObject.GObject):
         self.connect("fault", partial(GLib.idle_add, func))
         return self
 
+    def start(self):
+        """Queue the call to the L{_Executor}, it will be run by one of the
+        worker threads.
+        """
+        self.executor.submit(self)
+
     def run(self):
         """The actual function of the call.
 
@@ -91,26 +109,190 @@ class _Deferred(threading.Thread, GObject.GObject):
         else:
             self.emit('success')
 
+class _Executor(LoggingMixin):
+    """A fixed number of worker threads running L{_Deferred}s from a
+    bounded queue. When the queue is full, L{submit} fails the deferred
+    instead of waiting for the workers, so a slow server can't pile up
+    unlimited calls nor block the main loop.
+    """
+
+    def __init__(self, workers, queue_size):
+        LoggingMixin.__init__(self)
+
+        self.workers = workers
+
+        self._queue = queue.Queue(queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, deferred):
+        """Queue the deferred, starting the workers if necessary."""
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        try:
+            self._queue.put_nowait(deferred)
+        except queue.Full as error:
+            self.logger.warning('Too many calls waiting, dropping {}.'.format(
+                deferred.args[:1]))
+            deferred.error = error
+            deferred.emit('error')
+
+    def _work(self):
+        """Keep running deferreds from the queue."""
+        while True:
+            deferred = self._queue.get()
+            try:
+                deferred.run()
+            except Exception:
+                self.logger.exception('Unhandled error in {}.'.format(
+                    deferred.target))
+            finally:
+                self._queue.task_done()
+
+class _Transport(xmlrpc.client.Transport):
+    """HTTP/1.1 keep-alive transport, which reconnects once if the cached
+    connection has been closed by the server. Connecting and reading time
+    out after C{timeout} seconds, so a hung server can't hold the worker
+    threads forever.
+    """
+
+    _RECONNECT_ERRNOS = (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE)
+    """Socket errors meaning that the kept-alive connection is broken."""
+
+    def __init__(self, timeout):
+        xmlrpc.client.Transport.__init__(self)
+        self.timeout = timeout
+        self.last_used = time.time()
+
+    def make_connection(self, host):
+        connection = xmlrpc.client.Transport.make_connection(self, host)
+        # The socket is created with the timeout when it connects
+        connection.timeout = self.timeout
+        return connection
+
+    def request(self, host, handler, request_body, verbose=False):
+        try:
+            return self.single_request(host, handler, request_body, verbose)
+        except http.client.BadStatusLine:
+            self.close()
+        except socket.error as error:
+            if error.errno not in self._RECONNECT_ERRNOS:
+                raise
+            self.close()
+        return self.single_request(host, handler, request_body, verbose)
+
+    def close(self):
+        """Close the kept-alive connection, if any."""
+        if self._connection[1]:
+            self._connection[1].close()
+        self._connection = (None, None)
+
+class _TransportPool(object):
+    """A pool of L{_Transport}s shared by all threads calling the same
+    server. At most C{size} connections are opened at the same time,
+    connections idle for more than C{idle_timeout} seconds are closed.
+    """
+
+    def __init__(self, size, idle_timeout, timeout):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._idle = []
+        self._created = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Get an idle transport, or create a new one if the pool is not
+        full. Block until one is released otherwise.
+        """
+        with self._condition:
+            while not self._idle and self._created >= self.size:
+                self._condition.wait()
+            self._evict()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        return _Transport(self.timeout)
+
+    def release(self, transport):
+        """Put the transport back to the pool."""
+        with self._condition:
+            transport.last_used = time.time()
+            self._idle.append(transport)
+            self._evict()
+            self._condition.notify()
+
+    def _evict(self):
+        """Close connections of the transports idle for too long. The
+        transports themselves are kept and will reconnect when used.
+        """
+        deadline = time.time() - self.idle_timeout
+        for transport in self._idle:
+            if transport.last_used < deadline:
+                transport.close()
+
 class ServerProxy(object):
     """Designed to replace ServerProxy class in the standard library,
     which is not threadsafe. This class create a std C{ServerProxy}
-    when making a remote call.
+    when making a remote call, using a kept-alive transport from its
+    L{_TransportPool}.
     """
 
-    def __init__(self, connstr):
+    POOL_SIZE = 4
+    """Default max number of connections to the server."""
+
+    IDLE_TIMEOUT = 30
+    """Default seconds before closing an idle connection."""
+
+    QUEUE_SIZE = 128
+    """Default max number of calls waiting for a worker thread."""
+
+    TIMEOUT = 30
+    """Default seconds before connecting or reading from the server fails."""
+
+    def __init__(self, connstr, pool_size=POOL_SIZE, idle_timeout=IDLE_TIMEOUT,
+                 queue_size=QUEUE_SIZE, timeout=TIMEOUT):
         """L{ServerProxy} initializing.
 
+        The calls are run by C{pool_size} worker threads, so every worker
+        always gets a connection of its own.
+
         @arg connstr:The connection string of the proxy.
         @type connstr:L{str}
+        @arg pool_size:Max number of connections to the server.
+        @type pool_size:L{int}
+        @arg idle_timeout:Seconds before closing an idle connection.
+        @type idle_timeout:L{int}
+        @arg queue_size:Max number of calls waiting for a worker thread,
+        more calls fail with an error.
+        @type queue_size:L{int}
+        @arg timeout:Seconds before connecting or reading from the server
+        fails.
+        @type timeout:L{int}
 
         """
         self.connstr = connstr
+        self._transports = _TransportPool(pool_size, idle_timeout, timeout)
+        self._executor = _Executor(pool_size, queue_size)
 
     def call(self, funcstr, *args, **kwargs):
-        """Create a std C{ServerProxy} and return a L{_Deferred} to
-        call it. The returned L{_Deferred} must be started manually.
+        """Return a L{_Deferred} to call the remote function. The returned
+        L{_Deferred} must be started manually.
         """
-        proxy = xmlrpc.client.ServerProxy(self.connstr)
-        func = getattr(proxy, funcstr)
-        return _Deferred(func, args=args, kwargs=kwargs)
+        return _Deferred(self._executor, self._call,
+                         args=(funcstr,) + args, kwargs=kwargs)
+
+    def _call(self, funcstr, *args, **kwargs):
+        """Create a std C{ServerProxy} with a pooled transport and call it."""
+        transport = self._transports.acquire()
+        try:
+            proxy = xmlrpc.client.ServerProxy(self.connstr, transport=transport)
+            return getattr(proxy, funcstr)(*args, **kwargs)
+        finally:
+            self._transports.release(transport)
 
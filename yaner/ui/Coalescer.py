@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# vim:fileencoding=UTF-8
+
+# This file is part of Yaner.
+
+# Yaner - GTK+ interface for aria2 download mananger
+# Copyright (C) 2010-2011  Iven <ivenvd#gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This module contains the L{ChangeCoalescer} class, which batches the
+change notifications of the models.
+"""
+
+from collections import OrderedDict
+
+from gi.repository import GLib
+
+class ChangeCoalescer(object):
+    """
+    Collect the objects marked as changed, and flush them all at once at
+    most every L{interval} milliseconds. An object marked several times
+    before the flush is flushed only once.
+    """
+
+    INTERVAL = 200
+    """Default interval between flushes, in millisecond(s)."""
+
+    def __init__(self, flush_func, interval=INTERVAL):
+        """
+        L{ChangeCoalescer} initializing.
+        @arg flush_func:Function called with the list of changed objects.
+        @type flush_func:C{callable}
+        @arg interval:Interval between flushes, in millisecond(s).
+        @type interval:L{int}
+        """
+        self.flush_func = flush_func
+        self.interval = interval
+
+        self._dirty = OrderedDict()
+        self._handle = None
+
+    def mark(self, obj, *args):
+        """Mark the object as changed. Extra arguments are ignored, so this
+        can be connected to signals directly.
+        """
+        self._dirty[obj] = None
+        if self._handle is None:
+            self._handle = GLib.timeout_add(self.interval, self._on_timeout)
+
+    def flush(self):
+        """Flush the changed objects right now."""
+        if self._handle is not None:
+            GLib.source_remove(self._handle)
+            self._handle = None
+        self._flush()
+
+    def _on_timeout(self):
+        """Flush when the interval passed."""
+        self._handle = None
+        self._flush()
+        return False
+
+    def _flush(self):
+        """Call L{flush_func} with the changed objects, if any."""
+        if self._dirty:
+            dirty = list(self._dirty)
+            self._dirty.clear()
+            self.flush_func(dirty)
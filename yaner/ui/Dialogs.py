@@ -25,12 +25,10 @@ This module contains the dialog classes of L{yaner}.
 """
 
 import os
-import xmlrpc.client
 
 from gi.repository import Gtk, Gio
 from gi.repository.Gio import SettingsBindFlags as BindFlags
 
-from yaner.Task import Task
 from yaner.ui.Widgets import RightAlignedLabel, AlignedExpander
 from yaner.ui.Widgets import MetafileChooserButton, FileChooserEntry, URIsView
 from yaner.ui.Widgets import HORIZONTAL, VERTICAL, Box, Grid
@@ -268,7 +266,7 @@ class _TaskNewNormalUI(_TaskNewUI):
 
             name = options['out'] if options['out'] else os.path.basename(uris[0])
 
-            Task(name=name, uris=uris, options=options, category=category).start()
+            category.add_tasks([{'name': name, 'uris': uris, 'options': options}])
 
             return False
         else:
@@ -301,13 +299,13 @@ class _TaskNewBTUI(_TaskNewUI):
             else:
                 name = os.path.basename(torrent_filename)
                 with open(torrent_filename, 'br') as torrent_file:
-                    torrent = xmlrpc.client.Binary(torrent_file.read())
+                    torrent = torrent_file.read()
 
             uris = options.pop('uris')
             category = options.pop('category')
 
-            Task(name=name, torrent=torrent, uris=uris,
-                 options=options, category=category).start()
+            category.add_tasks([{'name': name, 'torrent': torrent,
+                                 'uris': uris, 'options': options}])
 
             return False
         else:
@@ -343,12 +341,12 @@ class _TaskNewMLUI(_TaskNewUI):
             else:
                 name = os.path.basename(metalink_filename)
                 with open(metalink_filename, 'br') as metalink_file:
-                    metafile = xmlrpc.client.Binary(metalink_file.read())
+                    metafile = metalink_file.read()
 
             category = options.pop('category')
 
-            Task(name=name, metafile=metafile, options=options,
-                 category=category).start()
+            category.add_tasks([{'name': name, 'metafile': metafile,
+                                 'options': options}])
             return False
         else:
             return _TaskNewUI.response(self, response_id)
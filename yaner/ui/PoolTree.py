@@ -32,6 +32,7 @@ from gi.repository import GLib
 from gi.repository import Pango
 
 from yaner.Presentable import Presentable
+from yaner.ui.Coalescer import ChangeCoalescer
 from yaner.ui.Misc import get_mix_color
 from yaner.utils.Enum import Enum
 from yaner.utils.Pretty import psize
@@ -48,6 +49,9 @@ class PoolModel(Gtk.TreeStore, LoggingMixin):
     C{COLUMNS.NAME} will return the column number of C{NAME}.
     """
 
+    _CHANGE_INTERVAL = 200
+    """Interval between updates of the changed rows, in millisecond(s)."""
+
     def __init__(self):
         """L{PoolModel} initializing."""
         Gtk.TreeStore.__init__(self, Presentable)
@@ -55,6 +59,11 @@ class PoolModel(Gtk.TreeStore, LoggingMixin):
 
         self._pool_handlers = {}
         self._presentable_handlers = {}
+        # Iters of C{Gtk.TreeStore} persist as long as the rows exist
+        self._presentable_iters = {}
+
+        self._changes = ChangeCoalescer(self._on_presentables_changed,
+                                        self._CHANGE_INTERVAL)
 
     def add_pool(self, pool):
         """When a pool is added to the model, connect signals, and add all
@@ -90,10 +99,17 @@ class PoolModel(Gtk.TreeStore, LoggingMixin):
         self.remove_presentable(presentable)
 
     def on_presentable_changed(self, presentable):
-        """When a presentable changed, update the iter of the model."""
-        iter_ = self.get_iter_for_presentable(presentable)
-        if iter_:
-            self.row_changed(self.get_path(iter_), iter_)
+        """When a presentable changed, update the iter of the model later,
+        along with other changed presentables.
+        """
+        self._changes.mark(presentable)
+
+    def _on_presentables_changed(self, presentables):
+        """Update the rows of the changed presentables."""
+        for presentable in presentables:
+            iter_ = self.get_iter_for_presentable(presentable)
+            if iter_:
+                self.row_changed(self.get_path(iter_), iter_)
 
     def add_presentable(self, presentable, insert=False):
         """Add a presentable to the model."""
@@ -117,31 +133,34 @@ class PoolModel(Gtk.TreeStore, LoggingMixin):
         else:
             iter_ = self.append(parent_iter)
         self.set(iter_, self.COLUMNS.PRESENTABLE, presentable)
+        self._presentable_iters[presentable] = iter_
 
         handler = presentable.connect('changed', self.on_presentable_changed)
         self._presentable_handlers[presentable] = handler
 
     def remove_presentable(self, presentable):
         """Remove a presentable from the model."""
-        iter_ = self.get_iter_for_presentable(presentable)
+        iter_ = self._presentable_iters.get(presentable)
         if iter_ is not None:
+            self._forget_iters(iter_)
             self.remove(iter_)
         if presentable in self._presentable_handlers:
             presentable.disconnect(self._presentable_handlers.pop(presentable))
 
-    def get_iter_for_presentable(self, presentable, parent=None):
-        """Get the TreeIter according to the presentable."""
-        iter_ = self.iter_children(parent)
-        while iter_:
-            if presentable is self.get_presentable(iter_):
-                return iter_
-
-            result = self.get_iter_for_presentable(presentable, iter_)
-            if result:
-                return result
+    def _forget_iters(self, iter_):
+        """Forget the iters of the row and its children, which are going
+        to be removed.
+        """
+        self._presentable_iters.pop(self.get_presentable(iter_), None)
+        child = self.iter_children(iter_)
+        while child is not None:
+            self._forget_iters(child)
+            child = self.iter_next(child)
 
-            iter_ = self.iter_next(iter_)
-        return None
+    def get_iter_for_presentable(self, presentable):
+        """Get the TreeIter according to the presentable."""
+        iter_ = self._presentable_iters.get(presentable)
+        return None if iter_ is None else iter_.copy()
 
     def get_presentable(self, iter_):
         """Get the presentable according to the given iter."""
@@ -229,9 +248,8 @@ class PoolView(Gtk.TreeView):
         # Get the color for the description
         color = get_mix_color(self, state)
 
-        tasks = list(presentable.tasks)
-        total_length = sum(task.total_length for task in tasks)
-        description = _('{} Task(s) {}').format(len(tasks), psize(total_length))
+        description = _('{} Task(s) {}').format(presentable.task_count,
+                                                psize(presentable.total_length))
         markup = '<small>' \
                      '<b>{}</b>\n' \
                      '<span fgcolor="{}">{}</span>' \
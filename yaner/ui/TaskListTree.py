@@ -25,34 +25,69 @@ This module contains the classes of the task list tree view on the
 topright of the toplevel window.
 """
 
+from collections import OrderedDict
+
 from gi.repository import Gtk
 from gi.repository import GLib
+from gi.repository import GObject
 from gi.repository import Pango
 
-from yaner.Task import Task
+from yaner.Task import TaskRecord
+from yaner.ui.Coalescer import ChangeCoalescer
 from yaner.ui.Misc import get_mix_color
 from yaner.utils.Enum import Enum
 from yaner.utils.Pretty import psize, pspeed
 from yaner.utils.Logging import LoggingMixin
 
-class TaskListModel(Gtk.TreeStore, LoggingMixin):
+class TaskListModel(GObject.GObject, Gtk.TreeModel, LoggingMixin):
     """
-    The tree interface used by task list treeviews.
+    The flat list interface used by task list treeviews.
+
+    The model is backed by a list of tasks, rows are only exposed when the
+    view asks for them, so switching to a presentable with lots of tasks
+    doesn't build any rows at all. The tasks are stored in the order they
+    are added, while the view shows the latest one as the first row.
+
+    Completed and removed tasks may be L{TaskRecord}s, which are promoted
+    to L{Task}s by L{get_task}, while the views render the rows from
+    L{get_record}.
+
+    Tasks added and removed are applied to the rows in one pass when the
+    main loop is idle, so bulk operations don't renumber the rows for
+    every task. When too many rows change at once, "rows-reset" is emitted
+    instead of a signal for each row, and views should be detached and
+    attached again, like L{TaskListView} does.
     """
 
+    __gsignals__ = {
+            'rows-reset': (GObject.SignalFlags.RUN_LAST, None, ()),
+            }
+    """GObject signals of this class."""
+
     COLUMNS = Enum('TASK')
     """
     The column names of the tree model, which is a L{Enum<yaner.utils.Enum>}.
     C{COLUMNS.NAME} will return the column number of C{NAME}.
     """
 
+    _STAMP = 0x7A5C
+    """Stamp of the iters of the model."""
+
+    _CHANGE_INTERVAL = 200
+    """Interval between updates of the changed rows, in millisecond(s)."""
+
+    _ROWS_RESET_THRESHOLD = 100
+    """Max number of rows added and removed in one pass with a signal for
+    each row, "rows-reset" is emitted for more.
+    """
+
     def __init__(self, presentable = None):
         """
         L{TaskListModel} initializing.
         @arg tasks:Tasks providing data to L{TaskListModel}.
         @type tasks:L{yaner.Task}
         """
-        Gtk.TreeStore.__init__(self, Task)
+        GObject.GObject.__init__(self)
         LoggingMixin.__init__(self)
 
         self._presentable = None
@@ -60,6 +95,16 @@ class TaskListModel(Gtk.TreeStore, LoggingMixin):
         self._presentable_handlers = {}
         self._task_handlers = {}
 
+        self._tasks = []
+        self._positions = {}
+
+        self._pending_rows = OrderedDict()
+        self._rows_handle = None
+
+        self._changes = ChangeCoalescer(self._on_tasks_changed,
+                                        self._CHANGE_INTERVAL)
+        self._visible_range_func = None
+
     @property
     def presentable(self):
         """Get the current presentable of the tree model."""
@@ -67,7 +112,12 @@ class TaskListModel(Gtk.TreeStore, LoggingMixin):
 
     @presentable.setter
     def presentable(self, new_presentable):
-        """Set the current presentable of the tree model, and update it."""
+        """Set the current presentable of the tree model, and update it.
+
+        No row signals are emitted, since that means one signal per task,
+        so views must be detached from the model meanwhile, see
+        L{TaskListView.set_presentable}.
+        """
         if self.presentable in self._presentable_handlers:
             for handler in self._presentable_handlers.pop(self.presentable):
                 self.presentable.disconnect(handler)
@@ -77,9 +127,22 @@ class TaskListModel(Gtk.TreeStore, LoggingMixin):
                 ]
         self._presentable = new_presentable
 
-        self.clear()
-        for task in new_presentable.tasks:
-            self.add_task(task)
+        for (task, handler) in self._task_handlers.items():
+            task.disconnect(handler)
+        self._task_handlers.clear()
+        # The records of the presentable have all the changes already
+        if self._rows_handle is not None:
+            GLib.source_remove(self._rows_handle)
+            self._rows_handle = None
+        self._pending_rows.clear()
+
+        self._tasks = list(new_presentable.records)
+        self._positions = dict((task.id, position) for (position, task)
+                               in enumerate(self._tasks))
+        for task in self._tasks:
+            if not isinstance(task, TaskRecord):
+                self._task_handlers[task] = task.connect('changed',
+                                                         self.on_task_changed)
 
     def on_task_added(self, presentable, task):
         """When new task added in the presentable, add it to the model."""
@@ -88,51 +151,227 @@ class TaskListModel(Gtk.TreeStore, LoggingMixin):
     def on_task_removed(self, presentable, task):
         """
         When a task removed from the presentable, remove it from
-        the model.
+        the model, along with other tasks removed meanwhile.
         """
-        iter_ = self.get_iter_for_task(task)
-        if iter_ is not None:
-            self.remove(iter_)
         if task in self._task_handlers:
             task.disconnect(self._task_handlers.pop(task))
+        self._pending_rows[task.id] = None
+        self._schedule_rows()
 
     def on_task_changed(self, task):
-        """When a task changed, update the iter of the model."""
-        iter_ = self.get_iter_for_task(task)
-        if iter_:
-            self.row_changed(self.get_path(iter_), iter_)
+        """When a task changed, update the iter of the model later, along
+        with other changed tasks.
+        """
+        self._changes.mark(task)
+
+    def set_visible_range_func(self, func):
+        """Set the function returning the first and last visible paths,
+        like C{Gtk.TreeView.get_visible_range}. Changes of the rows out of
+        the range are not notified, since they are read from the model
+        when scrolled into view anyway.
+        """
+        self._visible_range_func = func
+
+    def _on_tasks_changed(self, tasks):
+        """Update the rows of the changed tasks which are visible."""
+        (first, last) = (0, len(self._tasks) - 1)
+        if self._visible_range_func is not None:
+            visible_range = self._visible_range_func()
+            (start, end) = visible_range[-2:] if visible_range else (None, None)
+            if start is None or end is None:
+                return
+            (first, last) = (start.get_indices()[0], end.get_indices()[0])
+
+        for task in tasks:
+            position = self._positions.get(task.id)
+            if position is not None:
+                path = self._get_path(position)
+                if first <= path.get_indices()[0] <= last:
+                    self.row_changed(path, self._get_iter(position))
 
     def add_task(self, task):
-        """Add a task to the model."""
-        if not self.get_iter_for_task(task):
+        """Add a task to the model as the first row, along with other tasks
+        added meanwhile.
+        """
+        self._pending_rows[task.id] = task
+        self._schedule_rows()
+
+    def _schedule_rows(self):
+        """Apply the tasks added and removed when the main loop is idle."""
+        if self._rows_handle is None:
+            self._rows_handle = GLib.idle_add(self._on_rows_idle)
+
+    def _on_rows_idle(self):
+        """Apply the pending tasks added and removed."""
+        self._rows_handle = None
+        self.flush_rows()
+        return False
+
+    def flush_rows(self):
+        """Apply the tasks added and removed right now, in one pass. A task
+        removed and added again keeps its row.
+        """
+        if self._rows_handle is not None:
+            GLib.source_remove(self._rows_handle)
+            self._rows_handle = None
+        pending = self._pending_rows
+        self._pending_rows = OrderedDict()
+
+        removed = []
+        added = []
+        for (id_, task) in pending.items():
+            position = self._positions.get(id_)
+            if task is None:
+                if position is not None:
+                    removed.append(position)
+            elif position is None:
+                added.append(task)
+            else:
+                self._tasks[position] = task
+                self._connect_task(task)
+        reset = len(removed) + len(added) > self._ROWS_RESET_THRESHOLD
+
+        # Remove the last rows of the list first, so the positions of the
+        # others are kept, and renumber the rows left only once
+        removed.sort(reverse=True)
+        for position in removed:
+            path = self._get_path(position)
+            del self._positions[self._tasks[position].id]
+            del self._tasks[position]
+            if not reset:
+                self.row_deleted(path)
+        if removed:
+            for index in range(removed[-1], len(self._tasks)):
+                self._positions[self._tasks[index].id] = index
+
+        for task in added:
             self.logger.debug('Adding {}...'.format(task))
-            iter_ = self.insert(None, 0)
-            self.set(iter_, self.COLUMNS.TASK, task)
-
-            handler = task.connect('changed', self.on_task_changed)
-            self._task_handlers[task] = handler
-
-    def get_iter_for_task(self, task, parent=None):
+            position = len(self._tasks)
+            self._tasks.append(task)
+            self._positions[task.id] = position
+            self._connect_task(task)
+            if not reset:
+                self.row_inserted(self._get_path(position),
+                                  self._get_iter(position))
+
+        if reset:
+            self.emit('rows-reset')
+
+    def _connect_task(self, task):
+        """Update the row when the task changed."""
+        if not isinstance(task, TaskRecord) and task not in self._task_handlers:
+            self._task_handlers[task] = task.connect('changed',
+                                                     self.on_task_changed)
+
+    def get_iter_for_task(self, task):
         """Get the TreeIter according to the task."""
-        iter_ = self.iter_children(parent)
-        while not iter_ is None:
-            if task is self.get_task(iter_):
-                return iter_
-
-            result = self.get_iter_for_task(task, iter_)
-            if result:
-                return result
-
-            iter_ = self.iter_next(iter_)
-        return None
+        position = self._positions.get(task.id)
+        return None if position is None else self._get_iter(position)
 
     def get_task(self, iter_):
-        """Get the task according to the given iter."""
-        return self.get_value(iter_, self.COLUMNS.TASK)
+        """Get the task according to the given iter, promoting the
+        L{TaskRecord} to L{Task} if necessary, to act on it.
+        """
+        return self.get_tasks([iter_])[0]
+
+    def get_tasks(self, iters):
+        """Get the tasks according to the given iters, like L{get_task},
+        with the L{TaskRecord}s promoted in bulk.
+        """
+        if not iters:
+            return []
+        positions = [self._get_position(iter_) for iter_ in iters]
+        records = [self._tasks[position] for position in positions]
+        tasks = self.presentable.pool.promote_tasks(records)
+        for (position, record, task) in zip(positions, records, tasks):
+            if task is not record:
+                self._tasks[position] = task
+                self._task_handlers[task] = task.connect('changed',
+                                                         self.on_task_changed)
+        return tasks
+
+    def get_record(self, iter_):
+        """Get the task or its L{TaskRecord} according to the given iter,
+        to render it.
+        """
+        return self._tasks[self._get_position(iter_)]
+
+    def _get_iter(self, position):
+        """Get the iter of the task at the position of the list."""
+        iter_ = Gtk.TreeIter()
+        iter_.stamp = self._STAMP
+        # Zero means NULL for the pointer
+        iter_.user_data = position + 1
+        return iter_
+
+    def _get_position(self, iter_):
+        """Get the position in the list of the task the iter points to."""
+        return iter_.user_data - 1
+
+    def _get_path(self, position):
+        """Get the path of the task at the position of the list."""
+        return Gtk.TreePath.new_from_indices([len(self._tasks) - 1 - position])
+
+    def do_get_flags(self):
+        return Gtk.TreeModelFlags.LIST_ONLY
+
+    def do_get_n_columns(self):
+        return 1
+
+    def do_get_column_type(self, index):
+        return GObject.TYPE_PYOBJECT
+
+    def do_get_iter(self, path):
+        indices = path.get_indices()
+        if len(indices) == 1 and 0 <= indices[0] < len(self._tasks):
+            return (True, self._get_iter(len(self._tasks) - 1 - indices[0]))
+        return (False, None)
+
+    def do_get_path(self, iter_):
+        return self._get_path(self._get_position(iter_))
+
+    def do_get_value(self, iter_, column):
+        return self._tasks[self._get_position(iter_)]
+
+    def do_iter_next(self, iter_):
+        position = self._get_position(iter_) - 1
+        if position < 0:
+            return False
+        iter_.user_data = position + 1
+        return True
+
+    def do_iter_previous(self, iter_):
+        position = self._get_position(iter_) + 1
+        if position >= len(self._tasks):
+            return False
+        iter_.user_data = position + 1
+        return True
+
+    def do_iter_children(self, parent):
+        if parent is None and self._tasks:
+            return (True, self._get_iter(len(self._tasks) - 1))
+        return (False, None)
+
+    def do_iter_has_child(self, iter_):
+        return False
+
+    def do_iter_n_children(self, iter_):
+        return len(self._tasks) if iter_ is None else 0
+
+    def do_iter_nth_child(self, parent, n):
+        if parent is None and 0 <= n < len(self._tasks):
+            return (True, self._get_iter(len(self._tasks) - 1 - n))
+        return (False, None)
+
+    def do_iter_parent(self, child):
+        return (False, None)
 
 class TaskListView(Gtk.TreeView):
     """
     The C{Gtk.TreeView} displaying L{TaskListModel}.
+
+    All rows have the same height, so the view only measures the rows
+    shown instead of all rows of the model.
     """
 
     def __init__(self, model):
@@ -143,8 +382,14 @@ class TaskListView(Gtk.TreeView):
         """
         Gtk.TreeView.__init__(self, model)
 
+        self._presentable_handler = None
+
+        model.set_visible_range_func(self.get_visible_range)
+        model.connect('rows-reset', self._on_rows_reset)
+
         # Set up columns
         column = Gtk.TreeViewColumn(_('Tasks'))
+        column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
         column.set_expand(True)
         column.set_resizable(True)
         self.append_column(column)
@@ -158,6 +403,7 @@ class TaskListView(Gtk.TreeView):
         column.set_cell_data_func(renderer, self._desc_data_func)
 
         column = Gtk.TreeViewColumn(_('Progress'))
+        column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
         column.set_expand(True)
         column.set_resizable(True)
         self.append_column(column)
@@ -167,6 +413,8 @@ class TaskListView(Gtk.TreeView):
         column.set_cell_data_func(renderer, self._progress_data_func)
 
         column = Gtk.TreeViewColumn(_('Speed'))
+        column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        column.set_fixed_width(100)
         column.set_resizable(True)
         self.append_column(column)
 
@@ -175,6 +423,8 @@ class TaskListView(Gtk.TreeView):
         column.set_cell_data_func(renderer, self._speed_data_func)
 
         column = Gtk.TreeViewColumn(_('Connections'))
+        column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        column.set_fixed_width(90)
         column.set_resizable(True)
         self.append_column(column)
 
@@ -182,6 +432,8 @@ class TaskListView(Gtk.TreeView):
         column.pack_start(renderer, True)
         column.set_cell_data_func(renderer, self._connection_data_func)
 
+        self.set_fixed_height_mode(True)
+
     @property
     def selection(self):
         """Get the C{Gtk.TreeSelection} of the tree view."""
@@ -191,11 +443,45 @@ class TaskListView(Gtk.TreeView):
     def selected_tasks(self):
         """Get selected tasks."""
         (model, paths) = self.selection.get_selected_rows()
-        return [model.get_task(model.get_iter(path)) for path in paths]
+        return model.get_tasks([model.get_iter(path) for path in paths])
+
+    @property
+    def selected_records(self):
+        """Get selected tasks, with the ones not loaded as L{TaskRecord}s."""
+        (model, paths) = self.selection.get_selected_rows()
+        return [model.get_record(model.get_iter(path)) for path in paths]
+
+    def set_presentable(self, presentable):
+        """Show the tasks of the presentable. The model is detached while
+        switching, so the view simply rebuilds its rows when it's attached
+        again, instead of handling a signal for every task. The same is
+        done when the tasks of the presentable are reset in bulk.
+        """
+        if self._presentable_handler is not None:
+            (old_presentable, handler) = self._presentable_handler
+            old_presentable.disconnect(handler)
+        self._presentable_handler = (presentable, presentable.connect(
+            'tasks-reset', self._on_tasks_reset))
+
+        model = self.get_model()
+        self.set_model(None)
+        model.presentable = presentable
+        self.set_model(model)
+
+    def _on_tasks_reset(self, presentable):
+        """When the tasks of the presentable shown are reset, reload them."""
+        self.set_presentable(presentable)
+
+    def _on_rows_reset(self, model):
+        """When lots of rows of the model changed at once, rebuild the rows
+        by attaching the model again.
+        """
+        self.set_model(None)
+        self.set_model(model)
 
     def _status_data_func(self, column, renderer, model, iter_, data=None):
         """Method for set the icon and its size in the column."""
-        task = model.get_task(iter_)
+        task = model.get_record(iter_)
         stock_ids = {'active': 'gtk-media-play',
                      'waiting': 'gtk-refresh',
                      'paused': 'gtk-media-pause',
@@ -211,7 +497,7 @@ class TaskListView(Gtk.TreeView):
 
     def _desc_data_func(self, column, renderer, model, iter_, data=None):
         """Method for format the description text in the column."""
-        task = model.get_task(iter_)
+        task = model.get_record(iter_)
         # Get current state of the iter
         if self.selection.iter_is_selected(iter_):
             if self.has_focus():
@@ -244,7 +530,7 @@ class TaskListView(Gtk.TreeView):
 
     def _progress_data_func(self, column, renderer, model, iter_, data=None):
         """Method for set the progress bar style in the column."""
-        task = model.get_task(iter_)
+        task = model.get_record(iter_)
         percent = 0 if (task.total_length == 0) else \
                 (task.completed_length / task.total_length)
 
@@ -257,18 +543,20 @@ class TaskListView(Gtk.TreeView):
 
     def _speed_data_func(self, column, renderer, model, iter_, data=None):
         """Method for set the up and down speed in the column."""
-        task = model.get_task(iter_)
+        task = model.get_record(iter_)
         text = []
         if task.is_active:
             if task.upload_speed:
                 text.append('\u2B06 {}'.format(pspeed(task.upload_speed)))
             if task.download_speed:
                 text.append('\u2B07 {}'.format(pspeed(task.download_speed)))
-        renderer.set_properties(text='\n'.join(text))
+        # Keep in the fixed row height, same as the description
+        renderer.set_properties(markup='<small>{}</small>'.format(
+            '\n'.join(text)))
 
     def _connection_data_func(self, column, renderer, model, iter_, data=None):
         """Method for set the connections in the column."""
-        task = model.get_task(iter_)
+        task = model.get_record(iter_)
         if task.is_active:
             text = task.connections
         else:
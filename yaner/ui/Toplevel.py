@@ -28,6 +28,7 @@ import os
 import sys
 import logging
 
+from collections import OrderedDict
 from gi.repository import Gtk
 from gi.repository import GObject
 from gi.repository import Gio
@@ -36,7 +37,7 @@ from gi.repository import Gdk
 from yaner import __version__, __author__
 from yaner.XDG import xdg_open
 from yaner.Pool import Pool
-from yaner.Database import SQLSession
+from yaner.Database import SQLSession, SQLCommitter
 from yaner.Presentable import Presentable, Category
 from yaner.ui.Dialogs import TaskNewDialog, PreferencesDialog
 from yaner.ui.InfoBars import CategoryBar, PoolBar
@@ -109,9 +110,6 @@ class Toplevel(Gtk.Window, LoggingMixin):
         vbox.pack_end(scrolled_window)
 
         task_list_view = TaskListView(self._task_list_model)
-        task_list_view.set_show_expanders(False)
-        task_list_view.set_level_indentation(16)
-        task_list_view.expand_all()
         task_list_view.selection.set_mode(Gtk.SelectionMode.MULTIPLE)
         task_list_view.connect('key-press-event',
                                self._on_task_list_view_key_pressed)
@@ -147,7 +145,7 @@ class Toplevel(Gtk.Window, LoggingMixin):
                                     self._on_pool_view_selection_changed)
 
         # Add Pools to the PoolModel
-        for pool in SQLSession.query(Pool):
+        for pool in Pool.load_all():
             self._pool_model.add_pool(pool)
         pool_view.expand_all()
         # Select first iter
@@ -433,7 +431,7 @@ class Toplevel(Gtk.Window, LoggingMixin):
         """
         presentable = self._pool_view.selected_presentable
         if presentable is not None:
-            self._task_list_model.presentable = presentable
+            self._task_list_view.set_presentable(presentable)
 
     def _on_preferences(self, action, data):
         """When preferences action is activated, call the preferences dialog."""
@@ -445,45 +443,46 @@ class Toplevel(Gtk.Window, LoggingMixin):
 
     def _on_task_start(self, action, data):
         """When task start button clicked, start or unpause the task."""
-        for task in self._task_list_view.selected_tasks:
-            task.start()
+        for (pool, tasks) in self._group_by_pool(
+                self._task_list_view.selected_tasks):
+            pool.start_tasks(tasks)
 
     def _on_task_pause(self, action, data):
         """When task pause button clicked, pause the task."""
-        for task in self._task_list_view.selected_tasks:
-            task.pause()
+        for (pool, tasks) in self._group_by_pool(
+                self._task_list_view.selected_tasks):
+            pool.pause_tasks(tasks)
 
     def _on_task_start_all(self, action, data):
         """Start or unpause all the tasks in the selected pool."""
         presentable = self._pool_view.selected_presentable
         if presentable is None or presentable.TYPE != Presentable.TYPES.QUEUING:
-            pools = SQLSession.query(Pool)
+            pools = Pool.get_all()
         else:
             pools = [presentable.pool]
 
         for pool in pools:
-            for task in pool.queuing.tasks:
-                task.start()
+            pool.start_tasks()
 
     def _on_task_pause_all(self, action, data):
         """Pause all the tasks in the selected pool."""
         presentable = self._pool_view.selected_presentable
         if presentable is None or presentable.TYPE != Presentable.TYPES.QUEUING:
-            pools = SQLSession.query(Pool)
+            pools = Pool.get_all()
         else:
             pools = [presentable.pool]
 
         for pool in pools:
-            for task in pool.queuing.tasks:
-                task.pause()
+            pool.pause_tasks()
 
     def _on_task_remove(self, action=None, data=None):
         """When task remove button clicked, remove the task."""
-        tasks = self._task_list_view.selected_tasks
-        if not tasks:
-            return
-
-        if self._pool_view.selected_presentable.TYPE == Presentable.TYPES.DUSTBIN:
+        presentable = self._pool_view.selected_presentable
+        if presentable.TYPE == Presentable.TYPES.DUSTBIN:
+            # The records are enough to delete the tasks
+            records = self._task_list_view.selected_records
+            if not records:
+                return
             dialog = Gtk.MessageDialog(self, Gtk.DialogFlags.MODAL,
                                        Gtk.MessageType.WARNING,
                                        Gtk.ButtonsType.YES_NO,
@@ -492,16 +491,27 @@ class Toplevel(Gtk.Window, LoggingMixin):
             response = dialog.run()
             dialog.destroy()
             if response == Gtk.ResponseType.YES:
-                for task in tasks:
-                    task.remove()
+                presentable.pool.remove_tasks(records)
         else:
-            for task in tasks:
-                task.trash()
+            tasks = self._task_list_view.selected_tasks
+            for (pool, pool_tasks) in self._group_by_pool(tasks):
+                pool.trash_tasks(pool_tasks)
 
     def _on_task_restore(self, action, data):
         """When task is removed, restore the task."""
-        for task in self._task_list_view.selected_tasks:
-            task.restore()
+        for (pool, tasks) in self._group_by_pool(
+                self._task_list_view.selected_tasks):
+            pool.restore_tasks(tasks)
+
+    @staticmethod
+    def _group_by_pool(tasks):
+        """Group the tasks by the pools they belong to, for the bulk
+        operations of L{Pool}.
+        """
+        groups = OrderedDict()
+        for task in tasks:
+            groups.setdefault(task.pool, []).append(task)
+        return groups.items()
 
     def do_configure_event(self, event):
         """When window size changed, save it in GSettings."""
@@ -521,9 +531,17 @@ class Toplevel(Gtk.Window, LoggingMixin):
 
     def _on_dustbin_empty(self, action, data):
         """Empty dustbin."""
-        if self._pool_view.selected_presentable.TYPE == Presentable.TYPES.DUSTBIN:
-            self._task_list_view.get_selection().select_all()
-            self.action_group.get_action('task_remove').activate()
+        dustbin = self._pool_view.selected_presentable
+        if dustbin.TYPE == Presentable.TYPES.DUSTBIN and dustbin.task_count:
+            dialog = Gtk.MessageDialog(self, Gtk.DialogFlags.MODAL,
+                                       Gtk.MessageType.WARNING,
+                                       Gtk.ButtonsType.YES_NO,
+                                       _('Are you sure to remove these tasks?'),
+                                      )
+            response = dialog.run()
+            dialog.destroy()
+            if response == Gtk.ResponseType.YES:
+                dustbin.pool.empty_dustbin()
 
     def _on_category_add(self, action, data):
         """Add category."""
@@ -560,14 +578,10 @@ class Toplevel(Gtk.Window, LoggingMixin):
         response = dialog.run()
         dialog.destroy()
         if response == Gtk.ResponseType.YES:
-            # Move all tasks to default category
-            for task in category.tasks:
-                task.category = pool.default_category
-                pool.default_category.add_task(task)
             # Remove the category iter
             self._pool_model.remove_presentable(category)
-            SQLSession.delete(category)
-            SQLSession.commit()
+            # Move all tasks to default category
+            pool.remove_category(category)
 
     def _on_category_bar_response(self, info_bar, response_id):
         """When category_bar responsed, create or edit category."""
@@ -595,7 +609,7 @@ class Toplevel(Gtk.Window, LoggingMixin):
         else:
             category.name=name
             category.directory=directory
-            SQLSession.commit()
+            SQLCommitter.schedule()
         info_bar.hide()
 
     def _on_pool_add(self, action, data):
@@ -634,13 +648,12 @@ class Toplevel(Gtk.Window, LoggingMixin):
         dialog.destroy()
         if response == Gtk.ResponseType.YES:
             # Select the local pool, in order to remove the selected pool
-            local_pool = SQLSession.query(Pool).filter(Pool.is_local == True)[0]
+            local_pool = [other for other in Pool.get_all() if other.is_local][0]
             iter_ = self._pool_model.get_iter_for_presentable(local_pool.queuing)
             self._pool_view.selection.select_iter(iter_)
             # Remove the category iter
             self._pool_model.remove_pool(pool)
-            SQLSession.delete(pool)
-            SQLSession.commit()
+            pool.remove()
 
     def _on_pool_bar_response(self, info_bar, response_id):
         """When pool bar responsed, create or edit pool."""
@@ -670,7 +683,7 @@ class Toplevel(Gtk.Window, LoggingMixin):
             pool.port = props['port']
             pool.user = props['user']
             pool.passwd = props['passwd']
-            SQLSession.commit()
+            SQLCommitter.schedule()
 
         info_bar.hide()
 